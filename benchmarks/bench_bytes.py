@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Bytes render benchmark: a mostly static page rendered and encoded, against render_bytes."""
+import sys
+import timeit
+sys.path.insert(0, '..')
+
+from tempy.tags import Html, Head, Title, Body, Div, P, Ul, Li, A
+from tempy import Content
+
+
+def build_page():
+    return Html()(
+        Head()(Title()(Content('title'))),
+        Body()(
+            Div(klass='menu')(Ul()(Li()(A(href='/page/%d' % i)('Pàge %d' % i)) for i in range(200))),
+            Div(klass='content')(P()(Content('text'))),
+            Div(klass='footer')(P()('Fööter %d' % i) for i in range(50))
+        )
+    )
+
+
+if __name__ == '__main__':
+    page = build_page()
+    context = {'title': 'Title', 'text': 'Some text'}
+    runs = 10000
+    encoded = min(timeit.repeat(lambda: page.render(context=context).encode('utf-8'), number=runs, repeat=3))
+    print('render().encode(): %.0f renders/s' % (runs / encoded))
+    as_bytes = min(timeit.repeat(lambda: page.render_bytes(context=context), number=runs, repeat=3))
+    print('render_bytes(): %.0f renders/s' % (runs / as_bytes))
+    chunks = min(timeit.repeat(lambda: page.render_bytes(context=context, join=False), number=runs, repeat=3))
+    print('render_bytes(join=False): %.0f renders/s' % (runs / chunks))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Clone benchmark: customizes and renders a copy of a shared layout for every request."""
+import sys
+import timeit
+sys.path.insert(0, '..')
+
+from tempy.tags import Html, Head, Title, Body, Div, Ul, Li, P
+from tempy import Content
+
+SECTIONS, ITEMS = 50, 20
+
+
+def build_layout():
+    return Html()(
+        Head()(Title()(Content('title'))),
+        body=Body()(
+            nav=Div()(Ul()(Div()(Li()('link %d' % i) for i in range(ITEMS)) for _ in range(SECTIONS))),
+            container=Div(klass='container'),
+            footer=Div()(P()('footer %d' % i) for i in range(ITEMS))
+        )
+    )
+
+
+def request(layout):
+    page = layout.clone()
+    page.body.container(P()(Content('text')))
+    return page.render(title='Page', text='Hello')
+
+
+if __name__ == '__main__':
+    layout = build_layout()
+    layout.render(title='Layout')
+    runs = 1000
+    best = min(timeit.repeat(lambda: request(layout), number=runs, repeat=3))
+    print('%d requests in %.4fs: %.0f requests/s' % (runs, best, runs / best))
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""Construction micro-benchmark: builds a big table and reports how many nodes per second are created."""
+import sys
+import timeit
+sys.path.insert(0, '..')
+
+from tempy.tags import Table, Tbody, Tr, Td
+
+ROWS, COLS = 1000, 10
+NODES = 2 + ROWS * (COLS + 1)
+
+
+def build_table():
+    return Table()(Tbody()(Tr()(Td()(c) for c in range(COLS)) for _ in range(ROWS)))
+
+
+if __name__ == '__main__':
+    runs = 5
+    best = min(timeit.repeat(build_table, number=1, repeat=runs))
+    print('%d nodes in %.4fs (best of %d): %.0f nodes/s' % (NODES, best, runs, NODES / best))
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Escaping overhead benchmark: renders the star wars page with escaped data and with Markup (raw) data."""
+import json
+import sys
+import timeit
+sys.path.insert(0, '..')
+
+from tempy import Markup
+from playground_templates.sw import page
+
+with open('sw-people.json', 'r') as f:
+    people = list(json.load(f).values())
+raw_people = [{k: Markup(v) for k, v in character.items()} for character in people]
+
+
+if __name__ == '__main__':
+    runs, number = 5, 200
+    escaped = min(timeit.repeat(lambda: page.render(characters=people), number=number, repeat=runs))
+    raw = min(timeit.repeat(lambda: page.render(characters=raw_people), number=number, repeat=runs))
+    print('raw: %.3fms/render, escaped: %.3fms/render, overhead: %.1f%%' % (
+        raw / number * 1000, escaped / number * 1000, (escaped - raw) / raw * 100))
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Insertion benchmark: builds a table body with one row per record, adding the rows in a single call."""
+import sys
+import timeit
+sys.path.insert(0, '..')
+
+from tempy.tags import Tbody, Tr, Td
+
+ROWS = 50000
+
+
+def build(rows):
+    return Tbody()(Tr()(Td()(r)) for r in rows)
+
+
+def append(tbody, rows):
+    return tbody.append([Tr() for _ in rows])
+
+
+if __name__ == '__main__':
+    rows = range(ROWS)
+    best = min(timeit.repeat(lambda: build(rows), number=1, repeat=5))
+    print('%d rows built in %.4fs' % (ROWS, best))
+    best = min(timeit.repeat(lambda: append(Tbody(), rows), number=1, repeat=5))
+    print('%d empty rows appended in %.4fs' % (ROWS, best))
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Memory benchmark: builds a big table and reports the allocated bytes per node."""
+import sys
+import tracemalloc
+sys.path.insert(0, '..')
+
+from tempy.tags import Table, Tbody, Tr, Td
+
+ROWS, COLS = 10000, 10
+NODES = 2 + ROWS * (COLS + 1)
+
+
+def build_table():
+    return Table()(Tbody()(Tr()(Td()(c) for c in range(COLS)) for _ in range(ROWS)))
+
+
+if __name__ == '__main__':
+    tracemalloc.start()
+    table = build_table()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('%d nodes, %.1f MB: %.0f bytes/node' % (NODES, size / 2 ** 20, size / NODES))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Parallel render benchmark: renders a page with one section per record using 1 to cpu_count processes."""
+import os
+import sys
+import time
+sys.path.insert(0, '..')
+
+from tempy.tags import Html, Body, Div, H2, P, Ul, Li
+from tempy import Content
+
+RECORDS = 20000
+
+
+def build_page():
+    return Html()(Body()(
+        Div(klass='record', id='r%d' % i)(
+            H2()('Record %d' % i),
+            P()(Content('intro')),
+            Ul()(Li()('field %d: %d' % (f, i * f)) for f in range(10))
+        ) for i in range(RECORDS)
+    ))
+
+
+def timed(**kwargs):
+    # Every run renders a new page, as a report generation job would
+    page = build_page()
+    start = time.perf_counter()
+    page.render(context={'intro': 'Generated report'}, **kwargs)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    serial = timed()
+    print('serial: %.3fs' % serial)
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        elapsed = timed(parallel=workers)
+        print('%d workers: %.3fs (%.2fx)' % (workers, elapsed, serial / elapsed))
+        workers *= 2
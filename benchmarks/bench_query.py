@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Query benchmark: indexed lookups on a big table, compared with a plain walk of the tree."""
+import sys
+import timeit
+sys.path.insert(0, '..')
+
+from tempy.tags import Table, Tr, Td, Span
+
+ROWS = 50000
+
+
+def build_table():
+    return Table()(Tr(id='r%d' % i, klass='odd' if i % 2 else 'even')(
+        Td()(i), Td(klass='value')(Span(klass='flag')) if i % 1000 == 999 else Td()('-')
+    ) for i in range(ROWS))
+
+
+def timed(name, query, walk):
+    query_time = min(timeit.repeat(query, number=10, repeat=3)) / 10
+    walk_time = min(timeit.repeat(walk, number=1, repeat=3))
+    print('%-24s query: %.6fs  walk: %.6fs  (%.1fx)' % (name, query_time, walk_time, walk_time / query_time))
+
+
+if __name__ == '__main__':
+    table = build_table()
+    table.find(id='r0')
+    row = table[ROWS // 2]
+    last = 'r%d' % (ROWS - 1)
+    timed('find by id', lambda: table.find(id=last),
+          lambda: next(n for n in table.dfs_preorder() if n.attrs.get('id') == last))
+    timed('find first td', lambda: table.find('td'),
+          lambda: next(n for n in table.dfs_preorder() if isinstance(n, Td)))
+    timed('find_all rare class', lambda: table.find_all(klass='flag'),
+          lambda: [n for n in table.dfs_preorder() if 'flag' in n.attrs.get('klass', ())])
+    timed('select rare', lambda: table.select('tr.odd > td.value span'),
+          lambda: [n for n in table.dfs_preorder() if 'flag' in n.attrs.get('klass', ())])
+    timed('row find_all td', lambda: row.find_all('td'),
+          lambda: [n for n in row.dfs_preorder() if isinstance(n, Td)])
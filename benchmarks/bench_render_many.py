@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Batch render benchmark: renders a product page for many records, in a loop and with render_many."""
+import sys
+import timeit
+sys.path.insert(0, '..')
+
+from tempy.tags import Html, Head, Title, Body, Div, H1, P, Ul, Li
+from tempy import Content
+
+RECORDS = 20000
+
+
+def build_page():
+    return Html()(
+        Head()(Title()(Content('name'))),
+        Body()(
+            Div(klass='menu')(Ul()(Li()('link %d' % i) for i in range(20))),
+            Div(klass='product')(H1()(Content('name')), P()(Content('description')), P()(Content('price'))),
+            Div(klass='footer')('footer')
+        )
+    )
+
+
+CONTEXTS = [{'name': 'Product %d' % i, 'description': 'Description of %d' % i, 'price': i * 1.5}
+            for i in range(RECORDS)]
+
+
+def render_loop(page):
+    for context in CONTEXTS:
+        page.render(**context)
+
+
+def render_many(page):
+    for _ in page.render_many(CONTEXTS):
+        pass
+
+
+if __name__ == '__main__':
+    for func in (render_loop, render_many):
+        page = build_page()
+        best = min(timeit.repeat(lambda: func(page), number=1, repeat=3))
+        print('%s: %d documents in %.4fs: %.0f documents/s' % (func.__name__, RECORDS, best, RECORDS / best))
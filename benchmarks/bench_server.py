@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 import json
-from flask import Flask, render_template
+from flask import Flask, Response, render_template
 from playground_templates.sw import page
 
 
@@ -11,7 +11,7 @@ with open('sw-people.json', 'r') as f:
 
 @app.route('/tempy')
 def tempy_handler():
-    return page.render(characters=people.values())
+    return Response(page.render_bytes(context={'characters': people.values()}), content_type='text/html; charset=utf-8')
 
 @app.route('/j2')
 def j2_handler():
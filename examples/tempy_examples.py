@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 import json
-from flask import Flask
+from flask import Flask, Response
 
 app = Flask(__name__)
 
@@ -20,5 +20,12 @@ def tempy_handler():
         people = list(json.load(f).values())
     return page.render(characters=people)
 
+@app.route('/star_wars_stream')
+def tempy_stream_handler():
+    from templates.star_wars import page
+    with open('sw-people.json', 'r') as f:
+        people = list(json.load(f).values())
+    return Response(page.render_iter(context={'characters': people}))
+
 if __name__ == '__main__':
     app.run(port=8888, debug=False)
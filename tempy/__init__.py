@@ -1,5 +1,6 @@
 from .tags import *
 from .tempy import Content, Css
+from .markup import Markup, escape
 
 __version__ = '0.1'
 VERSION = tuple(map(int, __version__.split('.')))
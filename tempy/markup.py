@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Federico Cerchiari <federicocerchiari@gmail.com>
+Html escaping used in the render path, and the Markup type to skip it.
+"""
+
+
+class Markup(str):
+    """A string already safe for html: it will be rendered as it is, without escaping.
+    Any object with an __html__ method is considered safe in the same way.
+    """
+    __slots__ = ()
+
+    def __html__(self):
+        return self
+
+
+def escape(value):
+    """Returns the string of the given value with the html special characters escaped.
+    Markup strings and objects with an __html__ method are not escaped.
+    """
+    if type(value) is not str:
+        if hasattr(value, '__html__'):
+            return value.__html__()
+        value = str(value)
+    # Chained replaces are faster than str.translate in CPython
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    return value.replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;').replace("'", '&#x27;')
@@ -7,6 +7,7 @@ from .tempy import Tag, VoidTag
 
 
 class Comment(VoidTag):
+    __slots__ = ()
     __tag = ''
     _template = '<!-- {attrs} -->'
 
@@ -16,493 +17,618 @@ class Comment(VoidTag):
 
 
 class Doctype(VoidTag):
+    __slots__ = ()
     __tag = '!DOCTYPE'
     _template = '<{tag}{attrs}>'
 
 
 class A(Tag):
+    __slots__ = ()
     __tag = 'a'
 
 
 class Abbr(Tag):
+    __slots__ = ()
     __tag = 'abbr'
 
 
 class Acronym(Tag):
+    __slots__ = ()
     __tag = 'acronym'
 
 
 class Address(Tag):
+    __slots__ = ()
     __tag = 'address'
 
 
 class Applet(Tag):
+    __slots__ = ()
     __tag = 'applet'
 
 
 class Area(VoidTag):
+    __slots__ = ()
     __tag = 'area'
 
 
 class Article(Tag):
+    __slots__ = ()
     __tag = 'article'
 
 
 class Aside(Tag):
+    __slots__ = ()
     __tag = 'aside'
 
 
 class Audio(Tag):
+    __slots__ = ()
     __tag = 'audio'
 
 
 class B(Tag):
+    __slots__ = ()
     __tag = 'b'
 
 
 class Base(VoidTag):
+    __slots__ = ()
     __tag = 'base'
 
 
 class Basefont(Tag):
+    __slots__ = ()
     __tag = 'basefont'
 
 
 class Bdi(Tag):
+    __slots__ = ()
     __tag = 'bdi'
 
 
 class Bdo(Tag):
+    __slots__ = ()
     __tag = 'bdo'
 
 
 class Big(Tag):
+    __slots__ = ()
     __tag = 'big'
 
 
 class Blockquote(Tag):
+    __slots__ = ()
     __tag = 'blockquote'
 
 
 class Body(Tag):
+    __slots__ = ()
     __tag = 'body'
 
 
 class Br(VoidTag):
+    __slots__ = ()
     __tag = 'br'
 
 
 class Button(Tag):
+    __slots__ = ()
     __tag = 'button'
 
 
 class Canvas(Tag):
+    __slots__ = ()
     __tag = 'canvas'
 
 
 class Caption(Tag):
+    __slots__ = ()
     __tag = 'caption'
 
 
 class Center(Tag):
+    __slots__ = ()
     __tag = 'center'
 
 
 class Cite(Tag):
+    __slots__ = ()
     __tag = 'cite'
 
 
 class Code(Tag):
+    __slots__ = ()
     __tag = 'code'
 
 
 class Col(VoidTag):
+    __slots__ = ()
     __tag = 'col'
 
 
 class Colgroup(Tag):
+    __slots__ = ()
     __tag = 'colgroup'
 
 
 class Datalist(Tag):
+    __slots__ = ()
     __tag = 'datalist'
 
 
 class Dd(Tag):
+    __slots__ = ()
     __tag = 'dd'
 
 
 class Del(Tag):
+    __slots__ = ()
     __tag = 'del'
 
 
 class Details(Tag):
+    __slots__ = ()
     __tag = 'details'
 
 
 class Dfn(Tag):
+    __slots__ = ()
     __tag = 'dfn'
 
 
 class Dialog(Tag):
+    __slots__ = ()
     __tag = 'dialog'
 
 
 class Dir(Tag):
+    __slots__ = ()
     __tag = 'dir'
 
 
 class Div(Tag):
+    __slots__ = ()
     __tag = 'div'
 
 
 class Dl(Tag):
+    __slots__ = ()
     __tag = 'dl'
 
 
 class Dt(Tag):
+    __slots__ = ()
     __tag = 'dt'
 
 
 class Em(Tag):
+    __slots__ = ()
     __tag = 'em'
 
 
 class Embed(VoidTag):
+    __slots__ = ()
     __tag = 'embed'
 
 
 class Fieldset(Tag):
+    __slots__ = ()
     __tag = 'fieldset'
 
 
 class Figcaption(Tag):
+    __slots__ = ()
     __tag = 'figcaption'
 
 
 class Figure(Tag):
+    __slots__ = ()
     __tag = 'figure'
 
 
 class Font(Tag):
+    __slots__ = ()
     __tag = 'font'
 
 
 class Footer(Tag):
+    __slots__ = ()
     __tag = 'footer'
 
 
 class Form(Tag):
+    __slots__ = ()
     __tag = 'form'
 
 
 class Frame(Tag):
+    __slots__ = ()
     __tag = 'frame'
 
 
 class Frameset(Tag):
+    __slots__ = ()
     __tag = 'frameset'
 
 
 class H1(Tag):
+    __slots__ = ()
     __tag = 'h1'
 
 
 class H2(Tag):
+    __slots__ = ()
     __tag = 'h2'
 
 
 class H3(Tag):
+    __slots__ = ()
     __tag = 'h3'
 
 
 class H4(Tag):
+    __slots__ = ()
     __tag = 'h4'
 
 
 class H5(Tag):
+    __slots__ = ()
     __tag = 'h5'
 
 
 class H6(Tag):
+    __slots__ = ()
     __tag = 'h6'
 
 
 class Head(Tag):
+    __slots__ = ()
     __tag = 'head'
 
 
 class Header(Tag):
+    __slots__ = ()
     __tag = 'header'
 
 
 class Hr(VoidTag):
+    __slots__ = ()
     __tag = 'hr'
 
 
 class Html(Tag):
+    __slots__ = ()
     __tag = 'html'
 
 
 class I(Tag):
+    __slots__ = ()
     __tag = 'i'
 
 
 class Iframe(Tag):
+    __slots__ = ()
     __tag = 'iframe'
 
 
 class Img(VoidTag):
+    __slots__ = ()
     __tag = 'img'
 
 
 class Input(VoidTag):
+    __slots__ = ()
     __tag = 'input'
 
 
 class Ins(Tag):
+    __slots__ = ()
     __tag = 'ins'
 
 
 class Kbd(Tag):
+    __slots__ = ()
     __tag = 'kbd'
 
 
 class Keygen(Tag):
+    __slots__ = ()
     __tag = 'keygen'
 
 
 class Label(Tag):
+    __slots__ = ()
     __tag = 'label'
 
 
 class Legend(Tag):
+    __slots__ = ()
     __tag = 'legend'
 
 
 class Li(Tag):
+    __slots__ = ()
     __tag = 'li'
 
 
 class Link(VoidTag):
+    __slots__ = ()
     __tag = 'link'
 
 
 class Main(Tag):
+    __slots__ = ()
     __tag = 'main'
 
 
 class Map(Tag):
+    __slots__ = ()
     __tag = 'map'
 
 
 class Mark(Tag):
+    __slots__ = ()
     __tag = 'mark'
 
 
 class Menu(Tag):
+    __slots__ = ()
     __tag = 'menu'
 
 
 class Menuitem(Tag):
+    __slots__ = ()
     __tag = 'menuitem'
 
 
 class Meta(Tag):
+    __slots__ = ()
     __tag = 'meta'
 
 
 class Meter(Tag):
+    __slots__ = ()
     __tag = 'meter'
 
 
 class Nav(Tag):
+    __slots__ = ()
     __tag = 'nav'
 
 
 class Noframes(Tag):
+    __slots__ = ()
     __tag = 'noframes'
 
 
 class Noscript(Tag):
+    __slots__ = ()
     __tag = 'noscript'
 
 
 class Object(Tag):
+    __slots__ = ()
     __tag = 'object'
 
 
 class Ol(Tag):
+    __slots__ = ()
     __tag = 'ol'
 
 
 class Optgroup(Tag):
+    __slots__ = ()
     __tag = 'optgroup'
 
 
 class Option(Tag):
+    __slots__ = ()
     __tag = 'option'
 
 
 class Output(Tag):
+    __slots__ = ()
     __tag = 'output'
 
 
 class P(Tag):
+    __slots__ = ()
     __tag = 'p'
 
 
 class Param(VoidTag):
+    __slots__ = ()
     __tag = 'param'
 
 
 class Picture(Tag):
+    __slots__ = ()
     __tag = 'picture'
 
 
 class Pre(Tag):
+    __slots__ = ()
     __tag = 'pre'
 
 
 class Progress(Tag):
+    __slots__ = ()
     __tag = 'progress'
 
 
 class Q(Tag):
+    __slots__ = ()
     __tag = 'q'
 
 
 class Rp(Tag):
+    __slots__ = ()
     __tag = 'rp'
 
 
 class Rt(Tag):
+    __slots__ = ()
     __tag = 'rt'
 
 
 class Ruby(Tag):
+    __slots__ = ()
     __tag = 'ruby'
 
 
 class S(Tag):
+    __slots__ = ()
     __tag = 's'
 
 
 class Samp(Tag):
+    __slots__ = ()
     __tag = 'samp'
 
 
 class Script(Tag):
+    __slots__ = ()
     __tag = 'script'
+    _raw_text = True
 
 
 class Section(Tag):
+    __slots__ = ()
     __tag = 'section'
 
 
 class Select(Tag):
+    __slots__ = ()
     __tag = 'select'
 
 
 class Small(Tag):
+    __slots__ = ()
     __tag = 'small'
 
 
 class Source(VoidTag):
+    __slots__ = ()
     __tag = 'source'
 
 
 class Span(Tag):
+    __slots__ = ()
     __tag = 'span'
 
 
 class Strike(Tag):
+    __slots__ = ()
     __tag = 'strike'
 
 
 class Strong(Tag):
+    __slots__ = ()
     __tag = 'strong'
 
 
 class Style(Tag):
+    __slots__ = ()
     __tag = 'style'
+    _raw_text = True
 
 
 class Sub(Tag):
+    __slots__ = ()
     __tag = 'sub'
 
 
 class Summary(Tag):
+    __slots__ = ()
     __tag = 'summary'
 
 
 class Sup(Tag):
+    __slots__ = ()
     __tag = 'sup'
 
 
 class Table(Tag):
+    __slots__ = ()
     __tag = 'table'
 
 
 class Tbody(Tag):
+    __slots__ = ()
     __tag = 'tbody'
 
 
 class Td(Tag):
+    __slots__ = ()
     __tag = 'td'
 
 
 class Textarea(Tag):
+    __slots__ = ()
     __tag = 'textarea'
 
 
 class Tfoot(Tag):
+    __slots__ = ()
     __tag = 'tfoot'
 
 
 class Th(Tag):
+    __slots__ = ()
     __tag = 'th'
 
 
 class Thead(Tag):
+    __slots__ = ()
     __tag = 'thead'
 
 
 class Time(Tag):
+    __slots__ = ()
     __tag = 'time'
 
 
 class Title(Tag):
+    __slots__ = ()
     __tag = 'title'
 
 
 class Tr(Tag):
+    __slots__ = ()
     __tag = 'tr'
 
 
 class Track(VoidTag):
+    __slots__ = ()
     __tag = 'track'
 
 
 class Tt(Tag):
+    __slots__ = ()
     __tag = 'tt'
 
 
 class U(Tag):
+    __slots__ = ()
     __tag = 'u'
 
 
 class Ul(Tag):
+    __slots__ = ()
     __tag = 'ul'
 
 
 class Var(Tag):
+    __slots__ = ()
     __tag = 'var'
 
 
 class Video(Tag):
+    __slots__ = ()
     __tag = 'video'
 
 
 class Wbr(VoidTag):
+    __slots__ = ()
     __tag = 'wbr'
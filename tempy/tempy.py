@@ -1,38 +1,717 @@
 # -*- coding: utf-8 -*-
 # @author: Federico Cerchiari <federicocerchiari@gmail.com>
-from uuid import uuid4
+import asyncio
+import gc
+import os
+import pickle
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from inspect import isawaitable
+from multiprocessing import get_all_start_methods, get_context
 from copy import copy
 from functools import wraps
-from itertools import chain
-from collections import Mapping, OrderedDict, Iterable
+from hashlib import blake2b
+from itertools import compress, count, repeat
+from operator import is_
+from collections import ChainMap, OrderedDict, deque, namedtuple
+from collections.abc import Mapping, Iterable, Iterator
 from types import GeneratorType, MappingProxyType
+from weakref import WeakSet
 
 from .exceptions import TagError
+from .markup import escape
 
+# Process-local identity source for DOMElement and Content instances.
+_new_uid = count().__next__
 
-class _ChildElement:
-    """Wrapper used to manage element insertion."""
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
 
-    def __init__(self, name, obj):
-        super().__init__()
-        if not name and isinstance(obj, (DOMElement, Content)):
-            name = obj._name
-        self._name = name
-        self.obj = obj
+# Values rendered with str() that can be safely used as cache keys
+_KEY_TYPES = (str, int, float, bool, type(None))
+
+
+def _cache_key(value):
+    """Makes an hashable key from a content value, raises TypeError if the value can't be used as key.
+    Iterators and DOMElements are never used as keys: they can be consumed or changed after the render.
+    """
+    if type(value) is str:
+        return value
+    if isinstance(value, _KEY_TYPES):
+        return type(value), value
+    if isinstance(value, Mapping):
+        return dict, tuple((k, _cache_key(v)) for k, v in value.items())
+    if isinstance(value, Iterable) and not isinstance(value, (Iterator, DOMElement)):
+        return list, tuple(_cache_key(v) for v in value)
+    raise TypeError('unhashable content %r' % type(value))
+
+
+class _RenderCache:
+    """Bounded cache of rendered fragments, evicting the least recently used ('lru')
+    or the oldest inserted ('fifo') entry when full.
+    """
+    POLICIES = ('lru', 'fifo')
+
+    def __init__(self, maxsize, policy='lru'):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.policy == 'lru':
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                # Evicted by a concurrent render
+                pass
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+
+class _IndentedContent:
+    """Content placeholder of a pretty render plan, rendered on new lines indented with the given prefix.
+    Empty contents are rendered without adding a new line.
+    """
+    __slots__ = ('content', 'prefix', 'indent')
+
+    def __init__(self, content, prefix, indent):
+        self.content = content
+        self.prefix = prefix
+        self.indent = indent
+
+    def render(self):
+        return self._render_value(self.content._get_content())
+
+    def _render_value(self, value):
+        return self._new_line(self.content._render_value(value, self.prefix, self.indent))
+
+    def _fill(self, values):
+        return self._new_line(self.content._fill(values, self.prefix, self.indent))
+
+    def _new_line(self, rendered):
+        return '\n' + self.prefix + rendered if rendered else ''
+
+
+class _ParallelChunk:
+    """Placeholder of a parallel render plan: a slice of the parent's childs, rendered in a worker process
+    with the contents visible from the parent that the slice uses.
+    """
+    __slots__ = ('parent', 'start', 'stop', '_names')
+
+    def __init__(self, parent, start, stop):
+        self.parent = parent
+        self.start = start
+        self.stop = stop
+        self._names = None
+
+    @property
+    def childs(self):
+        return self.parent.childs[self.start:self.stop]
+
+    def names(self):
+        """Returns the names of the Content placeholders in the slice, and in their templates.
+        Only these contents are sent to the worker, so the others need not to be picklable.
+        """
+        if self._names is None:
+            names = set()
+            stack = list(self.childs)
+            while stack:
+                node = stack.pop()
+                if isinstance(node, DOMElement):
+                    stack.extend(node.childs)
+                elif isinstance(node, Content):
+                    if not node._fixed_content:
+                        names.add(node._name)
+                    if isinstance(node._template, DOMElement):
+                        stack.append(node._template)
+            self._names = names
+        return self._names
+
+    def _resolve(self, scope):
+        return {name: scope[name] for name in self.names() if name in scope}
+
+
+# Elements being rendered in parallel, inherited by the worker processes when they are forked
+_forked_roots = {}
+
+
+def _render_childs(childs, raw=False):
+    """Renders the given childs once, walking them without compiling.
+    Raw is True for the childs of raw text elements, whose text is not escaped.
+    """
+    rendered = []
+    text = str if raw else escape
+    for child in childs:
+        if isinstance(child, DOMElement):
+            rendered.extend(child.render_iter())
+        elif isinstance(child, Content):
+            rendered.append(child._render_value(child._get_content(), raw=raw))
+        else:
+            rendered.append(text(child))
+    return ''.join(rendered)
+
+
+def _render_forked_chunk(key, path, start, stop, context):
+    """Renders a slice of childs in a forked worker process, the element is found following the path
+    of childs indexes from the root. The worker has its own copy of the tree, so the context is injected in it.
+    """
+    root = _forked_roots[key]
+    if context:
+        root.inject(context)
+    node = root
+    for i in path:
+        node = node.childs[i]
+    return _render_childs(node.childs[start:stop], node._raw_text)
+
+
+def _unpickle_tree(records):
+    """Rebuilds a tree pickled by DOMElement.__reduce_ex__, the childs are linked before their parents."""
+    elements = [cls.__new__(cls) for cls, _, _, _ in records]
+    for element, (_, state, positions, child_records) in zip(reversed(elements), reversed(records)):
+        childs = state[1]
+        for i, record in zip(positions, child_records):
+            childs[i] = elements[record]
+        element.__setstate__(state)
+    return elements[0]
+
+
+def _render_pickled_chunk(data, contents, raw=False):
+    """Renders a pickled slice of childs in a worker process, contents are the ones visible from their parent."""
+    # Unpickling allocates lots of long lived objects, the collector would only slow it down
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        childs = pickle.loads(data)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    # The unpickled childs have no parent, a placeholder one holds the contents
+    holder = DOMElement()
+    holder._content_data = contents
+    for child in childs:
+        if isinstance(child, (DOMElement, Content)):
+            child.parent = holder
+    return _render_childs(childs, raw)
+
+
+class _RenderPlan:
+    """Flat render plan of a compiled element, made by DOMElement.compile.
+    Adjacent static chunks are merged in a single string, Content placeholders are kept as dynamic holes
+    and rendered at every render call. Owner is the element the plan was made for.
+    Compiled elements found in the parts are spliced in the plan, keeping track of them to resolve their holes,
+    the static ones keep their render only, as a string.
+    """
+    __slots__ = ('owner', 'parts', 'holes', 'splices', 'cache', 'scopes', 'encoded')
+
+    def __init__(self, parts, owner=None):
+        self.owner = owner
+        self.parts = []
+        self.holes = []
+        self.splices = []
+        self.cache = None
+        self.scopes = None
+        # Encoded static chunks, by encoding
+        self.encoded = None
+        static = []
+        for part in parts:
+            if isinstance(part, str):
+                static.append(part)
+            elif isinstance(part, DOMElement):
+                plan = part._plan
+                if isinstance(plan, str):
+                    static.append(plan)
+                    continue
+                if plan.holes:
+                    self.splices.append((len(self.holes), part, plan))
+                for chunk in plan.parts:
+                    if isinstance(chunk, str):
+                        static.append(chunk)
+                    else:
+                        if static:
+                            self.parts.append(''.join(static))
+                            static = []
+                        self.holes.append((len(self.parts), chunk))
+                        self.parts.append(chunk)
+            else:
+                if static:
+                    self.parts.append(''.join(static))
+                    static = []
+                self.holes.append((len(self.parts), part))
+                self.parts.append(part)
+        if static:
+            self.parts.append(''.join(static))
+
+    def render(self, values=None, root=None, context=None):
+        """Renders the plan. If values are given the holes are filled with them before searching in the tree.
+        If the element owning the plan is given as root, the contents are resolved in a single pass,
+        see resolve for the context.
+        """
+        if not self.holes:
+            return ''.join(self.parts)
+        parts = self.parts[:]
+        if values is not None:
+            for i, content in self.holes:
+                parts[i] = content._fill(values)
+        elif root is None:
+            for i, content in self.holes:
+                parts[i] = content.render()
+        else:
+            return self.fill(self.resolve(root, context))
+        return ''.join(parts)
+
+    def fill(self, values):
+        """Renders the plan filling the holes with the given contents, as returned by resolve."""
+        parts = self.parts[:]
+        if self.cache is not None:
+            return self._render_cached(parts, values)
+        for (i, content), value in zip(self.holes, values):
+            parts[i] = content._render_value(value)
+        return ''.join(parts)
+
+    def render_bytes(self, root, context=None, encoding='utf-8'):
+        """Returns the plan rendered as a list of encoded chunks.
+        The static chunks are encoded once and reused, only the holes are rendered and encoded at every call.
+        """
+        if self.encoded is None:
+            self.encoded = {}
+        encoded = self.encoded.get(encoding)
+        if encoded is None:
+            encoded = self.encoded[encoding] = [part.encode(encoding) if isinstance(part, str) else part
+                                                for part in self.parts]
+        parts = encoded[:]
+        if self.holes:
+            for (i, content), value in zip(self.holes, self.resolve(root, context)):
+                parts[i] = content._render_value(value).encode(encoding)
+        return parts
+
+    def resolve(self, root, context=None):
+        """Returns the content value of every hole.
+        The contents injected in the elements are carried down from the root in a chain of scopes,
+        so every hole is resolved with a single lookup in his own scope instead of walking his parents.
+        Nearest injections override the farther ones, as in DOMElement._find_content.
+        The context mapping is looked up as if it was injected in the root, without changing the tree.
+        """
+        elements, hole_scopes = self._get_scopes(root)
+        # The root scope holds the context and the contents injected in the root and in all his ancestors
+        maps = [context] if context else []
+        scopes = self._chain_scopes(elements, ChainMap(*maps + self._root_maps(root)))
+        return [content._resolve(scopes[scope]) for content, scope in hole_scopes]
+
+    def resolver(self, root):
+        """Returns a function returning the content of every hole for a given context, as resolve does.
+        Used to render many times a tree that is not changed meanwhile: the contents injected in the tree
+        are resolved once, only the names not injected below the root are searched in the contexts.
+        """
+        elements, hole_scopes = self._get_scopes(root)
+        outer = ChainMap(*self._root_maps(root))
+        scopes = self._chain_scopes(elements, ChainMap())
+        holes = []
+        for content, scope in hole_scopes:
+            if content._fixed_content or content._name in scopes[scope]:
+                holes.append((None, content._resolve(scopes[scope])))
+            else:
+                holes.append((content._name, outer.get(content._name, '')))
+
+        def resolve(context):
+            return [default if name is None else context.get(name, default) for name, default in holes]
+        return resolve
+
+    @staticmethod
+    def _root_maps(root):
+        """Returns the contents injected in the root and in all his ancestors, the nearest first."""
+        maps = []
+        node = root
+        while node is not None:
+            if node._content_data:
+                maps.append(node._content_data)
+            node = node.parent
+        return maps
+
+    @staticmethod
+    def _chain_scopes(elements, root_scope):
+        """Returns the scope of every element, from the given root scope down."""
+        scopes = [root_scope]
+        for element, parent in elements:
+            scope = scopes[parent]
+            if element._content_data:
+                scope = scope.new_child(element._content_data)
+            scopes.append(scope)
+        return scopes
+
+    def _get_scopes(self, root):
+        """Returns the elements between the holes and the owner, each after his parent and with the index of
+        the parent's scope, and the scope index of every hole's content.
+        The plan is dropped on every change of the tree, so this is made once per plan.
+        The scopes of the spliced plans are reused, relative to the element they were spliced for.
+        """
+        if self.scopes is not None:
+            return self.scopes
+        owner = self.owner if self.owner is not None else root
+        index = {id(owner): 0}
+        elements = []
+        hole_scopes = []
+
+        def scope_of(node):
+            path = []
+            while id(node) not in index:
+                path.append(node)
+                node = node.parent
+            scope = index[id(node)]
+            for node in reversed(path):
+                elements.append((node, scope))
+                scope = index[id(node)] = len(elements)
+            return scope
+
+        splices = iter(self.splices)
+        splice = next(splices, None)
+        h = 0
+        while h < len(self.holes):
+            if splice is not None and splice[0] == h:
+                _, element, plan = splice
+                base = scope_of(element)
+                offset = len(elements)
+                spliced_elements, spliced_holes = plan._get_scopes(element)
+                elements.extend((node, parent + offset if parent else base) for node, parent in spliced_elements)
+                hole_scopes.extend((content, scope + offset if scope else base) for content, scope in spliced_holes)
+                h += len(plan.holes)
+                splice = next(splices, None)
+            else:
+                content = self.holes[h][1]
+                if isinstance(content, _IndentedContent):
+                    content = content.content
+                hole_scopes.append((content, scope_of(content.parent)))
+                h += 1
+        self.scopes = elements, hole_scopes
+        return self.scopes
+
+    def _render_cached(self, parts, values):
+        """Renders the plan using the cache: the whole render is keyed by the values of all the holes,
+        on a miss every hole's render is searched in the cache keyed by its own value.
+        With a single hole the whole render is the only entry cached.
+        """
+        cache = self.cache
+        holes = []
+        for (i, content), value in zip(self.holes, values):
+            try:
+                key = (i, _cache_key(value), content._template and content._template_key())
+            except TypeError:
+                key = None
+            holes.append((i, content, value, key))
+        full_key = None
+        if all(key is not None for _, _, _, key in holes):
+            full_key = tuple(key for _, _, _, key in holes)
+            result = cache.get(full_key)
+            if result is not None:
+                return result
+        fragments = len(holes) > 1
+        for i, content, value, key in holes:
+            if not fragments:
+                key = None
+            fragment = cache.get(key) if key is not None else None
+            if fragment is None:
+                fragment = content._render_value(value)
+                if key is not None:
+                    cache.set(key, fragment)
+            parts[i] = fragment
+        result = ''.join(parts)
+        if full_key is not None:
+            cache.set(full_key, result)
+        return result
+
+
+def _tag_name(cls):
+    """Returns the html tag name of the given DOMElement class, None if the class has no tag."""
+    for klass in cls.__mro__:
+        name = getattr(klass, '_%s__tag' % klass.__name__, None)
+        if name is not None:
+            return name
+    return None
+
+
+class _QueryIndex:
+    """Indexes of a tree's elements by id, css class and type, referenced by all the indexed elements.
+    Built at the first query, updated when elements are inserted or removed and when the id and class
+    attributes are changed with the Tag api. Buckets are dicts used as insertion ordered sets.
+    An index is deactivated when his root is inserted in another tree, the elements of trees never
+    queried have no index, so they are changed with no indexing cost.
+    """
+    __slots__ = ('root', 'active', 'ids', 'classes', 'types', 'keys')
+
+    def __init__(self, root):
+        self.root = root
+        self.active = True
+        root._query = self
+        self.ids = {}
+        self.classes = {}
+        self.types = {}
+        # The indexed id and classes of every element, to remove them when changed
+        self.keys = {}
+        for child in root.childs:
+            if isinstance(child, DOMElement):
+                self.add(child)
+
+    @staticmethod
+    def element_keys(element):
+        """Returns the id and the css classes of the given element."""
+        attrs = getattr(element, 'attrs', None)
+        if not attrs:
+            return None, ()
+        ident = attrs.get('id')
+        classes = attrs.get('klass')
+        return (None if ident is None else str(ident),
+                tuple(klass for value in classes for klass in str(value).split()) if classes else ())
+
+    def add(self, element):
+        """Indexes the given element and his descendants."""
+        for node in element.dfs_preorder():
+            node._query = self
+            self.types.setdefault(type(node), {})[node] = None
+            self._add_keys(node)
+
+    def discard(self, element):
+        """Removes the given element and his descendants from the indexes."""
+        for node in element.dfs_preorder():
+            if node._query is self:
+                node._query = None
+            if node in self.keys:
+                self._discard(self.types, type(node), node)
+                self._discard_keys(node)
+
+    def update(self, element):
+        """Indexes again the id and classes of the given element."""
+        if element in self.keys:
+            self._discard_keys(element)
+            self._add_keys(element)
+
+    def _add_keys(self, node):
+        ident, classes = self.keys[node] = self.element_keys(node)
+        if ident is not None:
+            self.ids.setdefault(ident, {})[node] = None
+        for klass in classes:
+            self.classes.setdefault(klass, {})[node] = None
+
+    def _discard_keys(self, node):
+        ident, classes = self.keys.pop(node)
+        if ident is not None:
+            self._discard(self.ids, ident, node)
+        for klass in classes:
+            self._discard(self.classes, klass, node)
+
+    @staticmethod
+    def _discard(index, key, node):
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(node, None)
+            if not bucket:
+                del index[key]
+
+    def candidates(self, compound):
+        """Returns the buckets of the indexed elements that could match the given compound selector."""
+        tag, ident, classes = compound
+        buckets = []
+        if ident is not None:
+            buckets.append(self.ids.get(ident, ()))
+        for klass in classes:
+            buckets.append(self.classes.get(klass, ()))
+        if buckets:
+            return [min(buckets, key=len)]
+        return [bucket for cls, bucket in self.types.items() if _type_matches(cls, tag)]
+
+
+def _type_matches(cls, tag):
+    """Checks a DOMElement class against a tag name or a Tag class, None matches everything."""
+    if tag is None:
+        return True
+    if isinstance(tag, str):
+        return _tag_name(cls) == tag
+    return issubclass(cls, tag)
+
+
+def _matches(element, compound):
+    """Checks if an element matches a compound selector, a (tag, id, classes) tuple."""
+    tag, ident, classes = compound
+    if tag is not None and not _type_matches(type(element), tag):
+        return False
+    if ident is None and not classes:
+        return True
+    element_id, element_classes = _QueryIndex.element_keys(element)
+    if ident is not None and ident != element_id:
+        return False
+    return all(klass in element_classes for klass in classes)
+
+
+def _matches_ancestors(element, parts, combinators, i, memo):
+    """Checks the selector parts before the i-th, that the given element matches, on the element's ancestors.
+    For the descendant combinator, whether an ancestor matches the previous parts is stored in the memo dict
+    for every element walked: shared by the checks of a query, every element is walked once per part.
+    """
+    if not i:
+        return True
+    parent = element.parent
+    if combinators[i] == '>':
+        return parent is not None and _matches(parent, parts[i - 1]) and \
+            _matches_ancestors(parent, parts, combinators, i - 1, memo)
+    path = []
+    node = element
+    result = False
+    while node.parent is not None:
+        known = memo.get((id(node), i))
+        if known is not None:
+            result = known
+            break
+        path.append(node)
+        parent = node.parent
+        if _matches(parent, parts[i - 1]) and _matches_ancestors(parent, parts, combinators, i - 1, memo):
+            result = True
+            break
+        node = parent
+    for node in path:
+        memo[(id(node), i)] = result
+    return result
+
+
+def _parse_selector(selector):
+    """Parses a css selector in a list of groups, one for every comma separated selector.
+    Every group is a list of compound selectors and the list of the combinators preceding them.
+    Supported: tag names, *, #id and .class compounds, descendant and child (>) combinators.
+    """
+    groups = []
+    for group in selector.split(','):
+        parts, combinators, combinator = [], [], ' '
+        for token in group.replace('>', ' > ').split():
+            if token == '>':
+                if not parts or combinator == '>':
+                    raise TagError('Invalid selector %r' % selector)
+                combinator = '>'
+                continue
+            parts.append(_parse_compound(token, selector))
+            combinators.append(combinator)
+            combinator = ' '
+        if not parts or combinator == '>':
+            raise TagError('Invalid selector %r' % selector)
+        groups.append((parts, combinators))
+    return groups
+
+
+def _parse_compound(token, selector):
+    tag, ident, classes = None, None, []
+    pieces, marker, name = [], '', []
+    for char in token:
+        if char in '#.':
+            pieces.append((marker, ''.join(name)))
+            marker, name = char, []
+        elif char.isalnum() or char in '-_' or (char == '*' and not marker and not name):
+            name.append(char)
+        else:
+            raise TagError('Unsupported selector %r' % selector)
+    pieces.append((marker, ''.join(name)))
+    for marker, name in pieces:
+        if not marker:
+            if name and name != '*':
+                tag = name.lower()
+        elif not name or (marker == '#' and ident is not None):
+            raise TagError('Invalid selector %r' % selector)
+        elif marker == '#':
+            ident = name
+        else:
+            classes.append(name)
+    return tag, ident, tuple(classes)
 
 
 class DOMElement:
     """Takes care of the tree structure using the "childs" and "parent" attributes.
     Manages the DOM manipulation with proper valorization of those two.
+    Named childs are kept in a dedicated mapping and are accessible as attributes of this element.
     """
+    __slots__ = ('_name', '_childs', 'parent', '_content_data', 'uuid', '_plan', '_pretty', '_named_childs',
+                 '_idx', '_cache_conf', '_clean', '_size', '_source', '_clones', '_query',
+                 '__weakref__')
+    # Default size and eviction policy of the rendered outputs cache, a size of 0 disables the cache
+    render_cache_size = 0
+    render_cache_policy = 'lru'
+    # Raw text elements (script and style) render their text childs and contents without escaping them
+    _raw_text = False
+    # Elements with less than this many elements in their subtree keep their own plan, or their render
+    # if static, so a clean subtree is never walked again. Bigger elements keep a plan only if none of
+    # their childs holds more than 7/8 of their subtree: the levels of thin subtrees, as the long chains of
+    # deep trees, are rendered by their ancestors. Every element is held by O(log n) plans.
+    _plan_min_size = 8
 
     def __init__(self):
         super().__init__()
         self._name = None
-        self.childs = []
+        self._childs = []
         self.parent = None
-        self.content_data = {}
-        self.uuid = uuid4()
+        self._content_data = None
+        self.uuid = _new_uid()
+        self._plan = None
+        self._pretty = None
+        self._named_childs = None
+        # Last known position of this element in the parent's childs, checked before being trusted
+        self._idx = None
+        self._cache_conf = None
+        # True if nothing changed in this element's subtree since it was compiled
+        self._clean = False
+        # Number of elements in this element's subtree, counted when compiled
+        self._size = 0
+        # Element whose childs are shared by this copy until they are materialized, see _copy
+        self._source = None
+        # Copies sharing this element's childs
+        self._clones = None
+        # Query indexes of the tree, kept by the root
+        self._query = None
+
+    def __getattr__(self, name):
+        # Only called when normal lookup fails: search the named childs
+        if name[:1] != '_' and self._source is not None:
+            self._materialize()
+        if name != '_named_childs' and self._named_childs and name in self._named_childs:
+            return self._named_childs[name]
+        raise AttributeError('%r object has no attribute %r' % (type(self).__name__, name))
+
+    @property
+    def childs(self):
+        """The childs list of this element. A copy's childs are materialized at first access."""
+        if self._source is not None:
+            self._materialize()
+        return self._childs
+
+    @childs.setter
+    def childs(self, childs):
+        if self._source is not None:
+            self._materialize()
+        self._invalidate()
+        index = self._query
+        if index is not None and index.active:
+            for child in self._childs:
+                if isinstance(child, DOMElement):
+                    index.discard(child)
+        self._childs = childs
+        if index is not None and index.active:
+            for child in childs:
+                if isinstance(child, DOMElement):
+                    self._index_inserted(child)
+
+    @property
+    def content_data(self):
+        """The content data injected in this element, allocated at first use."""
+        if self._content_data is None:
+            self._content_data = {}
+        return self._content_data
 
     def __repr__(self):
         return '<{0}.{1} {2}. Son of {3}. Childs: {4}. Named \'{5}\'>'.format(
@@ -40,14 +719,14 @@ class DOMElement:
             type(self).__name__,
             self.uuid,
             '{} {}'.format(type(self.parent).__name__, self.parent.uuid) if self.parent else 'None',
-            len(self.childs),
+            len(self._childs if self._source is None else self._source._childs),
             self._name)
 
     def __hash__(self):
         return self.uuid
 
     def __eq__(self, other):
-        return self.uuid == other.uuid
+        return isinstance(other, DOMElement) and self.uuid == other.uuid
 
     def __getitem__(self, i):
         return self.childs[i]
@@ -62,132 +741,393 @@ class DOMElement:
         return x in self.childs
 
     def __copy__(self):
-        new = self.__class__()(copy(c) if isinstance(c, (DOMElement, Content)) else cfor c in self.childs)
-        if hasattr(new, 'attrs'):
-            new.attrs = self.attrs
+        return self._copy()
+
+    def _copy(self):
+        """Returns a copy-on-write copy of this element.
+        The copy shares this element's childs and render plans: the childs are copied only when the copy's
+        childs are accessed, one level at a time, each one being a shared copy too.
+        If this element, or one of his descendants, is changed while shared, the copies are materialized
+        before the change, so they keep the original tree.
+        """
+        if self._plan is None:
+            self.compile()
+        source = self._source if self._source is not None else self
+        new = self.__class__.__new__(self.__class__)
+        new._name = self._name
+        new._childs = None
+        new.parent = None
+        new._content_data = dict(self._content_data) if self._content_data else None
+        new.uuid = _new_uid()
+        new._plan = self._plan
+        new._pretty = self._pretty
+        new._named_childs = None
+        new._idx = None
+        new._cache_conf = self._cache_conf
+        new._clean = True
+        new._size = self._size
+        new._source = source
+        new._clones = None
+        new._query = None
+        if source._clones is None:
+            source._clones = WeakSet()
+        source._clones.add(new)
         return new
 
+    def _materialize(self):
+        """Replaces the shared childs of this copy with copies of the source's childs."""
+        source = self._source
+        # The shared plans refer to the source's elements, so they are dropped
+        self._invalidate()
+        source._clones.discard(self)
+        self._source = None
+        self._childs = []
+        for child in source._childs:
+            if isinstance(child, DOMElement):
+                child = child._copy()
+            elif isinstance(child, Content):
+                child = copy(child)
+            self._childs.append(child)
+        self._link_childs()
+
+    def _link_childs(self):
+        """Sets this element as parent of all his childs, indexing them and their names."""
+        for i, child in enumerate(self._childs):
+            if isinstance(child, (DOMElement, Content)):
+                child.parent = self
+                if isinstance(child, DOMElement):
+                    child._idx = i
+                if child._name:
+                    if self._named_childs is None:
+                        self._named_childs = {}
+                    self._named_childs[child._name] = child
+
+    def __getstate__(self):
+        """Pickles this element's subtree, without the parent and the render plans."""
+        return self._name, self.childs, self._content_data, self._cache_conf
+
+    def __reduce_ex__(self, protocol):
+        """Pickles the subtree as a flat list of the elements states, in document order, so the depth
+        of the tree is not limited by the recursion limit. In the states, the element childs are replaced
+        by None, their records are found by their positions in the list, see _unpickle_tree.
+        """
+        records = []
+        stack = [(self, None)]
+        while stack:
+            node, parent_records = stack.pop()
+            if parent_records is not None:
+                parent_records.append(len(records))
+            state = node.__getstate__()
+            childs = list(state[1])
+            positions = [i for i, child in enumerate(childs) if isinstance(child, DOMElement)]
+            for i in positions:
+                childs[i] = None
+            child_records = []
+            records.append((type(node), state[:1] + (childs, ) + state[2:], positions, child_records))
+            stack.extend((state[1][i], child_records) for i in reversed(positions))
+        return _unpickle_tree, (records, )
+
+    def __setstate__(self, state):
+        self._name, self._childs, self._content_data, self._cache_conf = state[:4]
+        self.parent = None
+        self.uuid = _new_uid()
+        self._plan = None
+        self._pretty = None
+        self._named_childs = None
+        self._idx = None
+        self._clean = False
+        self._size = 0
+        self._source = None
+        self._clones = None
+        self._query = None
+        self._link_childs()
+
+    @staticmethod
+    def _detach_clones(node):
+        """Materializes the copies sharing the given element or one of his ancestors, from the root down.
+        Only clean elements are shared, so the walk stops at the first changed one.
+        Returns the clean elements walked.
+        """
+        path = []
+        while node is not None and node._clean:
+            path.append(node)
+            node = node.parent
+        for node in reversed(path):
+            if node._clones:
+                for clone in list(node._clones):
+                    clone._materialize()
+                node._clones = None
+        return path
+
     @property
     def _own_index(self):
-        if self.parent:
-            return self.parent.childs.index(self)
-        return None
-
-    def _yield_items(self, items, kwitems, reverse=False):
-        """
-        Recursive generator, flattens the given items/kwitems.
-        Returns index after flattening and a _ChildElement.
-        "reverse" parameter inverts the yielding.
-        """
-        verse = (1, 0)[reverse]
-        unnamed = (_ChildElement(None, item) for item in items[::verse])
-        named = (_ChildElement(k, v) for k, v in list(kwitems.items())[::verse])
-        contents = (unnamed, named)[::verse]
-        for i, item in enumerate(chain(*contents)):
-            if type(item.obj) in (list, tuple, GeneratorType):
-                if item._name:
-                    # TODO: implement tag named containers
-                    # Happens when iterable in kwitems
-                    # i.e: d = Div(paragraphs=[P() for _ in range(5)])
-                    # d.paragraphs -> [P(), P(), P()...]
-                    yield i, item.obj
-                else:
-                    yield from self._yield_items(item.obj, {})
-            elif isinstance(item.obj, DOMElement):
-                yield i, item.obj
+        parent = self.parent
+        if parent is None:
+            return None
+        childs = parent.childs
+        idx = self._idx
+        if idx is not None:
+            # Inserting or popping a sibling before this element moves it by one position
+            for i in (idx, idx - 1, idx + 1):
+                if 0 <= i < len(childs) and childs[i] is self:
+                    self._idx = i
+                    return i
+        # Identity lookup, without calling __eq__ on every sibling
+        idx = next(compress(count(), map(is_, childs, repeat(self))), None)
+        if idx is None:
+            raise ValueError('%r is not in the parent childs' % self)
+        # The siblings are likely moved too: refreshing the scanned ones and as many following ones
+        # keeps the cost proportional to the scan, and the lookups of a whole list linear in any order
+        for i in range(min(len(childs), 2 * idx + 2)):
+            child = childs[i]
+            if isinstance(child, DOMElement):
+                child._idx = i
+        return idx
+
+    @staticmethod
+    def _flatten_items(items, kwitems):
+        """Flattens the given items in a list of childs, the lists, tuples and generators are unpacked.
+        The keyword items follow the positional ones, their keys are given as names to the elements.
+        """
+        childs = []
+        stack = [iter(items)]
+        while stack:
+            for item in stack[-1]:
+                if type(item) in (list, tuple, GeneratorType):
+                    stack.append(iter(item))
+                    break
+                childs.append(item)
             else:
-                yield i, item.obj
-
-    def content_receiver(reverse=False):
+                stack.pop()
+        for name, item in kwitems.items():
+            # TODO: implement tag named containers
+            # Iterables in kwitems are added as they are
+            # i.e: d = Div(paragraphs=[P() for _ in range(5)])
+            # d.paragraphs -> [P(), P(), P()...]
+            if isinstance(item, (DOMElement, Content)):
+                # Names given as keywords are stored in the element, to be used by the parent
+                item._name = name
+            childs.append(item)
+        return childs
+
+    def content_receiver():
         """Decorator for content adding methods.
-        Takes args and kwargs and calls the decorated method one time for each argument provided.
-        The reverse parameter should be used for prepending (relative to self) methods.
+        Takes args and kwargs, flattens them and calls the decorated method once with the list of childs.
         """
         def _receiver(func):
             @wraps(func)
             def wrapped(inst, *tags, **kwtags):
-                for i, tag in inst._yield_items(tags, kwtags, reverse):
-                    inst._stable = False
-                    func(inst, i, tag)
+                func(inst, inst._flatten_items(tags, kwtags))
                 return inst
             return wrapped
         return _receiver
 
+    def _insert_many(self, items, idx=None):
+        """Inserts the given list of childs at the given index, by default at the end.
+        Bulk version of _insert: the childs list is changed, and the element invalidated, once for all the items.
+        """
+        if not items:
+            return
+        childs = self.childs
+        size = len(childs)
+        if idx is None or idx > size:
+            idx = size
+        elif idx < 0:
+            idx = 0
+        if self._clean:
+            self._invalidate()
+        if idx == size:
+            childs.extend(items)
+        else:
+            childs[idx:idx] = items
+        named = self._named_childs
+        linked = (DOMElement, Content)
+        for i, child in enumerate(items, idx):
+            if isinstance(child, linked):
+                child.parent = self
+                if isinstance(child, DOMElement):
+                    child._idx = i
+                if child._name:
+                    if named is None:
+                        named = self._named_childs = {}
+                    named[child._name] = child
+        for child in items:
+            if isinstance(child, DOMElement) and (self._query is not None or child._query is not None):
+                self._index_inserted(child)
+
     def _insert(self, child, idx=None, prepend=False):
         """Inserts something inside this element.
         If provided at the given index, if prepend at the start of the childs list, by default at the end.
         If the child is a DOMElement, correctly links the child.
         If a name is provided, an attribute containing the child is created in this instance.
         """
+        childs = self.childs
         if idx and idx < 0:
             idx = 0
         if prepend:
             idx = 0
         else:
-            idx = idx if idx is not None else len(self.childs)
-        self.childs.insert(idx, child)
+            idx = idx if idx is not None else len(childs)
+        if self._clean:
+            self._invalidate()
+        childs.insert(idx, child)
         if isinstance(child, (DOMElement, Content)):
             child.parent = self
+            if isinstance(child, DOMElement):
+                child._idx = min(idx, len(childs) - 1)
             if child._name:
-                setattr(self, child._name, child)
+                if self._named_childs is None:
+                    self._named_childs = {}
+                self._named_childs[child._name] = child
+            if isinstance(child, DOMElement) and (self._query is not None or child._query is not None):
+                self._index_inserted(child)
+
+    def _invalidate(self):
+        """Marks this element and all his ancestors as changed, discarding their render plans.
+        An element is marked clean only when all his childs are, so a changed element never has
+        a clean ancestor: the upward walk can stop at the first element already changed.
+        Plans are made only for clean elements, so they are all discarded by the walk.
+        The copies sharing the changed elements are materialized before the change.
+        """
+        for node in self._detach_clones(self):
+            node._clean = False
+            node._plan = None
+            node._pretty = None
 
     def _find_content(self, cont_name):
-        """Search for a content_name in the content data, if not found the parent is searched."""
-        try:
-            a = self.content_data[cont_name]
-            return a
-        except KeyError:
-            if self.parent:
-                return self.parent._find_content(cont_name)
-            else:
-                # Fallback for no content (Raise NoContent?)
-                return ''
+        """Search for a content_name in the content data, if not found the parents are searched."""
+        node = self
+        while node is not None:
+            if node._content_data is not None and cont_name in node._content_data:
+                return node._content_data[cont_name]
+            node = node.parent
+        # Fallback for no content (Raise NoContent?)
+        return ''
 
     def inject(self, contents=None, **kwargs):
         """
         Adds content data in this element. This will be used in the rendering of this element's childs.
         Multiple injections on the same key will override the content (dict.update behavior).
+        Contents are searched at render time, so injection never invalidates the rendering plans.
         """
-        self._stable = False
         if not contents:
             contents = {}
         if kwargs:
             contents.update(kwargs)
+        # Copies of the ancestors share this element's contents
+        self._detach_clones(self.parent)
         self.content_data.update(contents)
         return self
 
+    def compile(self):
+        """Compiles this element in a flat render plan.
+        Static subtrees are rendered once and folded in plain strings, only the Content placeholders
+        are left as dynamic holes. Following renders will be a single join over the plan.
+        The plan is discarded as soon as this element or one of his childs is modified using the TemPy api.
+        Childs are compiled too, so a change will only need to recompile the changed element's ancestors,
+        see _plan_min_size for the ones keeping a plan: the static ones keep their render as a string.
+        The tree is walked with an explicit stack, so the depth of the tree is not limited by the recursion limit.
+        """
+        min_size = self._plan_min_size
+        stack = [(self, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                # Clean childs are already compiled, only the changed ones are visited
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.childs
+                             if isinstance(child, DOMElement) and not child._clean)
+                continue
+            size = 1
+            largest = 0
+            for child in node.childs:
+                if isinstance(child, DOMElement):
+                    size += child._size
+                    if child._size > largest:
+                        largest = child._size
+            node._size = size
+            if node is self or size < min_size or largest * 8 <= size * 7:
+                plan = _RenderPlan(node._render_parts(), node)
+                if node is not self and not plan.holes:
+                    plan = plan.parts[0] if plan.parts else ''
+                node._plan = plan
+            node._clean = True
+        return self
+
+    def render_cache(self, maxsize=128, policy='lru'):
+        """Configures the cache of this element's rendered outputs, overriding the class defaults.
+        Renders are cached keyed by the values of the contents this element depends on, so repeated
+        renders with the same data are served from the cache. A maxsize of 0 disables the cache.
+        """
+        if policy not in _RenderCache.POLICIES:
+            raise TagError('Unknown cache policy %r' % policy)
+        self._cache_conf = (maxsize, policy)
+        if isinstance(self._plan, _RenderPlan):
+            self._plan.cache = None
+        return self
+
+    def cache_info(self):
+        """Returns hits, misses, maxsize and current size of this element's render cache."""
+        if isinstance(self._plan, _RenderPlan) and self._plan.cache is not None:
+            return self._plan.cache.info()
+        maxsize, _ = self._cache_conf or (self.render_cache_size, self.render_cache_policy)
+        return CacheInfo(0, 0, maxsize, 0)
+
+    def _get_pretty_plan(self, indent):
+        """Returns the plan of the indented render, cached apart from the compact one."""
+        if self._pretty is None or self._pretty[0] != indent:
+            # Walking the childs may materialize shared copies, so the element is compiled after
+            plan = _RenderPlan(self._pretty_parts('', indent), owner=self)
+            self._get_plan()
+            self._pretty = (indent, plan)
+        return self._pretty[1]
+
+    def _get_plan(self):
+        """Returns this element's plan, compiling the element and setting up his cache if needed."""
+        if self._plan is None:
+            self.compile()
+        plan = self._plan
+        if isinstance(plan, str):
+            # Compiled as a static part of a bigger tree
+            plan = self._plan = _RenderPlan((plan, ), self)
+        if plan.cache is None and plan.holes:
+            maxsize, policy = self._cache_conf or (self.render_cache_size, self.render_cache_policy)
+            if maxsize:
+                plan.cache = _RenderCache(maxsize, policy)
+        return plan
+
     def clone(self):
-        """Returns a deepcopy of this element."""
+        """Returns a copy of this element, sharing the unchanged subtrees with the original."""
         return copy(self)
 
     @content_receiver()
-    def __call__(self, _, child):
+    def __call__(self, childs):
         """Calling the object will add the given parameters as childs"""
-        self._insert(child)
+        self._insert_many(childs)
 
     @content_receiver()
-    def after(self, i, child):
+    def after(self, childs):
         """Adds siblings after the current tag."""
-        self.parent._insert(child, idx=self._own_index + 1 + i)
+        self.parent._insert_many(childs, idx=self._own_index + 1)
 
-    @content_receiver(reverse=True)
-    def before(self, i, child):
+    @content_receiver()
+    def before(self, childs):
         """Adds siblings before the current tag."""
-        self.parent._insert(child, idx=self._own_index - i)
+        self.parent._insert_many(childs, idx=self._own_index)
 
-    @content_receiver(reverse=True)
-    def prepend(self, child):
+    @content_receiver()
+    def prepend(self, childs):
         """Adds childs tho this tag, starting from the first position."""
-        self._insert(child, prepend=True)
+        self._insert_many(childs, idx=0)
 
     def prepend_to(self, father):
         """Adds this tag to a father, at the beginning."""
         father.prepend(self)
 
     @content_receiver()
-    def append(self, child):
+    def append(self, childs):
         """Adds childs to this tag, after the current existing childs."""
-        self._insert(child)
+        self._insert_many(childs)
 
     def append_to(self, father):
         """Adds this tag to a parent, after the current existing childs."""
@@ -208,42 +1148,45 @@ class DOMElement:
         pass
 
     def replace_with(self, other):
-        """Replace this element with the given DOMElement."""
-        if isinstance(other, DOMElement):
-            self = other
-        elif isinstance(other, (GeneratorType, Iterable)):
-            self.parent.childs[self._own_index: self._own_index+1] = list(other)
-        else:
+        """Replace this element with the given DOMElement, or with the given childs."""
+        if not isinstance(other, (DOMElement, str, GeneratorType, Iterable)):
             raise TagError()
-        return self
+        self.after(other)
+        return self.remove()
 
     def remove(self):
         """Detach this element from his father."""
-        if self._own_index and self.parent:
-            self.parent.pop(i=self._own_index)
+        if self.parent is not None:
+            self.parent.pop(self._own_index)
         return self
 
     def move(self, new_father, idx=None, prepend=None):
         """Moves this element from his father to the given one."""
-        self.parent.pop(i=self._own_index)
-        new_father._insert(self._name, self, idx, prepend)
-        new_father._stable = False
+        self.remove()
+        new_father._insert(self, idx, prepend)
         return self
 
     def pop(self, idx=None):
         """Removes the child at given position, if no position is given removes the last."""
-        self._stable = False
-        if not idx:
+        self._invalidate()
+        if idx is None:
             idx = len(self.childs) - 1
         elem = self.childs.pop(idx)
-        if isinstance(elem, DOMElement):
+        if isinstance(elem, (DOMElement, Content)):
             elem.parent = None
+            if isinstance(elem, DOMElement):
+                elem._idx = None
+            if elem._name and self._named_childs and self._named_childs.get(elem._name) is elem:
+                del self._named_childs[elem._name]
+            if isinstance(elem, DOMElement) and self._query is not None and self._query.active:
+                self._query.discard(elem)
         return elem
 
     def empty(self):
         """Remove all this tag's childs."""
-        self._stable = False
-        map(lambda child: self.pop(child._own_index), self.childs)
+        self._invalidate()
+        while self.childs:
+            self.pop()
         return self
 
     # TODO: Make all the following properties?
@@ -265,58 +1208,326 @@ class DOMElement:
 
     def next(self):
         """Returns the next sibling."""
-        return self.parent.child[self._own_index + 1]
+        return self.parent.childs[self._own_index + 1]
 
     def next_all(self):
         """Returns all the next siblings as a list."""
-        return self.parent.child[self._own_index + 1:]
+        return self.parent.childs[self._own_index + 1:]
 
     def prev(self):
         """Returns the previous sibling."""
-        return self.parent.child[self._own_index - 1]
+        idx = self._own_index
+        if not idx:
+            raise IndexError('no previous sibling')
+        return self.parent.childs[idx - 1]
 
     def prev_all(self):
         """Returns all the previous siblings as a list."""
-        return self.parent.child[:self._own_index - 1]
+        return self.parent.childs[:self._own_index]
 
     def siblings(self):
         """Returns all the siblings of this element as a list."""
         return filter(lambda x: x != self, self.parent.childs)
 
-    def parent(self):
-        """Returns this element's father"""
-        return self.parent
-
     def slice(self, start=None, end=None, step=None):
         """Slice of this element's childs as childs[start:end:step]"""
         return self.childs[start:end:step]
 
-    def _dfs_tags(self):
-        """Iterate the element inner content, in reverse depth-first.
-         Used to render the tags from the childmost ones to the root.
+    @property
+    def _root(self):
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    def _query_index(self):
+        """Returns the query indexes of this element's tree, building them at the first query."""
+        root = self._root
+        index = root._query
+        if index is None or not index.active or index.root is not root:
+            index = _QueryIndex(root)
+        return index
+
+    def _index_inserted(self, child):
+        """Indexes a child inserted in this element, the child is not the root of an indexed tree anymore."""
+        if child._query is not None and child._query.root is child:
+            child._query.active = False
+        index = self._query
+        if index is not None and index.active:
+            index.add(child)
+
+    def _index_changed(self):
+        """Indexes again the id and classes of this element after a change."""
+        index = self._query
+        if index is not None and index.active:
+            index.update(self)
+
+    # Queries walk the subtree if it's smaller than this many times the indexed candidates
+    _query_walk_factor = 8
+
+    def _select(self, groups, first=False):
+        """Returns the descendants of this element matching one of the given parsed selector groups,
+        in document order. If first, only the first one is returned, or None.
+        The subtree is walked while it's small compared to the indexed candidates, then the candidates
+        are checked: lookups never scan big trees for a few matches.
+        """
+        index = self._query_index()
+        candidates = [(parts, combinators, index.candidates(parts[-1])) for parts, combinators in groups]
+        limit = self._query_walk_factor * sum(len(bucket) for _, _, buckets in candidates for bucket in buckets)
+        found = []
+        walked = 0
+        # Ancestors matches, shared by all the checks: groups with different parts have different memos
+        memos = [{} for _ in groups]
+        for element in self.descendants():
+            if walked == limit:
+                break
+            walked += 1
+            if any(_matches(element, parts[-1]) and
+                   _matches_ancestors(element, parts, combinators, len(parts) - 1, memo)
+                   for (parts, combinators), memo in zip(groups, memos)):
+                if first:
+                    return element
+                found.append(element)
+        else:
+            return found if not first else None
+        # The subtree is too big to be walked, the candidates are checked
+        found = {}
+        inside = {}
+        for (parts, combinators, buckets), memo in zip(candidates, memos):
+            last = len(parts) - 1
+            for bucket in buckets:
+                for element in list(bucket):
+                    if element in found or not _matches(element, parts[last]):
+                        continue
+                    if not _matches_ancestors(element, parts, combinators, last, memo):
+                        continue
+                    if self.parent is not None and not self._contains(element, inside):
+                        continue
+                    found[element] = None
+        if first:
+            return min(found, key=self._document_position, default=None)
+        return sorted(found, key=self._document_position)
+
+    def _contains(self, element, inside):
+        """Checks if the element is a descendant of this element.
+        The results for the ancestors walked are stored in the inside dict, shared between the checks.
+        """
+        path = []
+        node = element.parent
+        while node is not None and node is not self:
+            result = inside.get(node)
+            if result is not None:
+                break
+            path.append(node)
+            node = node.parent
+        else:
+            result = node is self
+        for node in path:
+            inside[node] = result
+        return result
+
+    @staticmethod
+    def _document_position(element):
+        path = []
+        while element.parent is not None:
+            path.append(element._own_index)
+            element = element.parent
+        return path[::-1]
+
+    def find_all(self, tag=None, id=None, klass=None):
+        """Returns the descendants of this element matching all the given criteria, in document order.
+        tag can be a tag name or a Tag class (matching his subclasses too), klass one or more space separated classes.
+        Lookups use indexes of the whole tree, built at the first query and then kept updated by the
+        manipulation api: ids and classes changed in the attrs without the Tag api are not indexed.
+        """
+        if isinstance(tag, str):
+            tag = tag.lower()
+        compound = (tag, None if id is None else str(id), tuple(klass.split()) if klass else ())
+        return self._select((([compound], [' ']), ))
+
+    def find(self, tag=None, id=None, klass=None):
+        """Returns the first descendant of this element matching all the given criteria, None if not found."""
+        if isinstance(tag, str):
+            tag = tag.lower()
+        compound = (tag, None if id is None else str(id), tuple(klass.split()) if klass else ())
+        return self._select((([compound], [' ']), ), first=True)
+
+    def select(self, selector):
+        """Returns the descendants of this element matching the given css selector, in document order.
+        Tag names, *, #id and .class are supported, combined with the descendant and child (>) combinators,
+        and comma separated selectors, i.e. select('div.chr > p, #main a').
+        Like the css selectors, ancestors outside this element can match the first parts of the selector.
         """
-        # Based on http://www.ics.uci.edu/~eppstein/PADS/DFS.py
-        # by D. Eppstein, July 2004.
-        given = set()
-        stack = copy(self.childs)
+        return self._select(_parse_selector(selector))
+
+    def dfs_preorder(self):
+        """Yields this element and his descendant elements depth first, every element before his childs.
+        Strings and Content childs are skipped. The tree is walked lazily, without recursion.
+        """
+        yield self
+        stack = [iter(self.childs)]
         while stack:
-            tag = stack.pop()
-            if not tag.childs:
-                given.add(tag)
-                yield tag
+            for child in stack[-1]:
+                if isinstance(child, DOMElement):
+                    yield child
+                    stack.append(iter(child.childs))
+                    break
             else:
-                if set(tag.childs).issubset(given):
-                    given.add(tag)
-                    yield tag
-                else:
-                    stack.append(tag)
-                    stack += list(set(tag.childs) - given)
-        yield self
+                stack.pop()
+
+    def dfs_postorder(self):
+        """Yields this element and his descendant elements depth first, every element after his childs."""
+        stack = [(self, iter(self.childs))]
+        while stack:
+            node, childs = stack[-1]
+            for child in childs:
+                if isinstance(child, DOMElement):
+                    stack.append((child, iter(child.childs)))
+                    break
+            else:
+                stack.pop()
+                yield node
+
+    def bfs(self):
+        """Yields this element and his descendant elements breadth first."""
+        queue = deque((self, ))
+        while queue:
+            node = queue.popleft()
+            yield node
+            queue.extend(child for child in node.childs if isinstance(child, DOMElement))
+
+    def ancestors(self):
+        """Yields the parent of this element, then the parent's parent, up to the root."""
+        node = self.parent
+        while node is not None:
+            yield node
+            node = node.parent
+
+    def descendants(self, predicate=None):
+        """Yields the descendant elements of this element in document order.
+        If a predicate is given, only the elements for which it returns True.
+        """
+        nodes = self.dfs_preorder()
+        next(nodes)
+        if predicate is None:
+            yield from nodes
+        else:
+            yield from filter(predicate, nodes)
+
+    def _dfs_tags(self):
+        """Iterate the element inner content, depth first in post-order.
+         Used to render the tags from the childmost ones to the root.
+        """
+        return self.dfs_postorder()
 
     def render(self, *args, **kwargs):
         """Placeholder for subclass implementation"""
         raise NotImplementedError
 
+    def render_iter(self, *args, context=None, **kwargs):
+        """Renders the element and all his childrens as a generator of html chunks.
+        Nothing is rendered until the generator is consumed, Content values are consumed lazily,
+        so the output can be streamed without building the whole document in memory.
+        The context is used as in Tag.render, rendering with a context compiles the element.
+        """
+        self._inject_render_args(args, kwargs)
+        if context is not None:
+            self._get_plan()
+        plan = self._plan
+        if plan is None:
+            for part in self._render_parts():
+                if isinstance(part, (DOMElement, Content)):
+                    yield from part.render_iter()
+                else:
+                    yield part
+            return
+        if isinstance(plan, str):
+            yield plan
+            return
+        values = iter(plan.resolve(self, context))
+        for part in plan.parts:
+            if isinstance(part, Content):
+                yield from part._iter_contents(part._items(next(values)), stream=True)
+            else:
+                yield part
+
+    def render_to(self, fp, *args, context=None, encoding=None, buffer_size=65536, **kwargs):
+        """Renders the element and all his childrens writing the html in the given file-like object.
+        The chunks given by render_iter are buffered and written every buffer_size characters,
+        so the whole document is never held in memory. If an encoding is given the buffers are encoded
+        and written as bytes, for files opened in binary mode and sockets.
+        """
+        buffered = []
+        size = 0
+        for chunk in self.render_iter(*args, context=context, **kwargs):
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                self._write_buffer(fp, buffered, encoding)
+                buffered = []
+                size = 0
+        if buffered:
+            self._write_buffer(fp, buffered, encoding)
+        return self
+
+    @staticmethod
+    def _write_buffer(fp, buffered, encoding):
+        data = ''.join(buffered)
+        fp.write(data.encode(encoding) if encoding else data)
+
+    async def render_async(self, *args, context=None, **kwargs):
+        """Renders the element and all his childrens, awaiting coroutines and async iterables contents.
+        Every distinct awaitable content is resolved concurrently.
+        """
+        return ''.join([chunk async for chunk in self.render_async_iter(*args, context=context, **kwargs)])
+
+    async def render_async_iter(self, *args, context=None, **kwargs):
+        """Async generator version of render_iter.
+        All the awaitable contents are scheduled at once, chunks are yielded in document order
+        as soon as the contents they need are resolved.
+        """
+        self._inject_render_args(args, kwargs)
+        plan = self._get_plan()
+        parts = plan.parts
+        resolved = plan.resolve(self, context)
+        pending = {}
+        for value in resolved:
+            if Content._is_async(value) and id(value) not in pending:
+                pending[id(value)] = asyncio.ensure_future(Content._await_content(value))
+        values = iter(resolved)
+        try:
+            for part in parts:
+                if isinstance(part, Content):
+                    value = next(values)
+                    if id(value) in pending:
+                        value = await pending[id(value)]
+                    yield part._render_value(value)
+                else:
+                    yield part
+        finally:
+            for task in pending.values():
+                task.cancel()
+
+    def _inject_render_args(self, args, kwargs):
+        # args kwargs API provided for last minute content injection
+        for arg in args:
+            if isinstance(arg, dict):
+                self.inject(arg)
+        if kwargs:
+            self.inject(kwargs)
+
+    def _render_parts(self):
+        """Placeholder for subclass implementation.
+        Yields the static strings and the Content placeholders that compose this element's render.
+        """
+        raise NotImplementedError
+
+    def _pretty_parts(self, prefix, indent):
+        """Placeholder for subclass implementation.
+        Same as _render_parts for the indented render, prefix is the indentation of the element's line.
+        """
+        raise NotImplementedError
+
 
 class TagAttrs(dict):
     """
@@ -327,8 +1538,10 @@ class TagAttrs(dict):
     - mapping type attributes
         i.e. style attribute, an udpate will trigger the dict.update method
 
-    TagAttrs.render formats all the attributes in the proper html format.
+    TagAttrs.render formats all the attributes in the proper html format, the result is cached
+    until the attributes are changed with the dict api or with the Tag's attributes methods.
     """
+    __slots__ = ('_comment', '_rendered')
     _MAPPING_ATTRS = ('style', )
     _MULTI_VALUES_ATTRS = ('klass', 'typ', )
     _SPECIALS = {
@@ -337,12 +1550,18 @@ class TagAttrs(dict):
     }
     _FORMAT = {
         'style': lambda x: ' '.join('%s: %s;' % (k, v) for k, v in x.items()),
-        'klass': lambda x: ' '.join(x),
-        'typ': lambda x: ' '.join(x),
-        'comment': lambda x: x
+        'klass': ' '.join,
+        'typ': ' '.join,
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._comment = None
+        self._rendered = None
+        self.update(*args, **kwargs)
+
     def __setitem__(self, key, value):
+        self._rendered = None
         if key in self._MULTI_VALUES_ATTRS:
             if key not in self:
                 super().__setitem__(key, [])
@@ -361,37 +1580,84 @@ class TagAttrs(dict):
         for k, v in kwargs.items():
             self[k] = v
 
+    def __delitem__(self, key):
+        self._rendered = None
+        super().__delitem__(key)
+
+    def pop(self, *args):
+        self._rendered = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._rendered = None
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._rendered = None
+        return super().setdefault(key, default)
+
+    def __copy__(self):
+        # Multiple values and mappings are copied too, so they can be changed in place
+        new = self.__class__()
+        dict.update(new, ((k, copy(v)) for k, v in self.items()))
+        new._comment = self._comment
+        new._rendered = self._rendered
+        return new
+
+    def __reduce__(self):
+        # Unpickling with __setitem__ would nest the multiple values
+        return self._unpickle, (dict(self), self._comment)
+
+    @classmethod
+    def _unpickle(cls, attrs, comment):
+        new = cls.__new__(cls)
+        dict.update(new, attrs)
+        new._comment = comment
+        new._rendered = None
+        return new
+
+    def clear(self):
+        self._rendered = None
+        super().clear()
+
     def render(self):
         """Renders the tag's attributes using the formats and performing special attributes name substitution."""
-        if hasattr(self, '_comment'):
+        if self._rendered is None:
+            self._rendered = self._render()
+        return self._rendered
+
+    def _render(self):
+        if self._comment is not None:
             # Special case for the comment tag
             return self._comment
-        else:
-            return ''.join(' %s="%s"' % (self._SPECIALS.get(k, k),
-                                         self._FORMAT.get(k, lambda x: x)(v))
-                           for k, v in self.items() if v)
+        specials, formats = self._SPECIALS, self._FORMAT
+        rendered = []
+        for k, v in self.items():
+            if v:
+                if k in formats:
+                    v = formats[k](v)
+                rendered.append(' %s="%s"' % (specials.get(k, k), escape(v)))
+        return ''.join(rendered)
 
 
 class Tag(DOMElement):
     """
     Provides an api for tag inner manipulation and for rendering.
     """
+    __slots__ = ('attrs', '_data')
     _template = '<{tag}{attrs}>{inner}</{tag}>'
     _needed_kwargs = None
     _void = False
+    # Childs lists shorter than this are not splitted in parallel renders
+    _parallel_min_childs = 256
 
     def __init__(self, **kwargs):
+        super().__init__()
         self.attrs = TagAttrs()
-        self.data = {}
+        self._data = None
         if self._needed_kwargs and not set(self._needed_kwargs).issubset(set(kwargs)):
             raise TagError()
         self.attr(**kwargs)
-        self._tab_count = 0
-        self._render = None
-        self._stable = False
-        super().__init__()
-        if self._void:
-            self._render = self.render()
 
     def __repr__(self):
         css_repr = '%s%s' % (
@@ -400,6 +1666,19 @@ class Tag(DOMElement):
             )
         return super().__repr__()[:-1] + '{}>'.format(css_repr)
 
+    def __getstate__(self):
+        return super().__getstate__() + (self.attrs, self._data)
+
+    def __setstate__(self, state):
+        self.attrs, self._data = state[4:]
+        super().__setstate__(state)
+
+    def _copy(self):
+        new = super()._copy()
+        new.attrs = copy(self.attrs)
+        new._data = dict(self._data) if self._data else None
+        return new
+
     @property
     def length(self):
         """Returns the number of childs."""
@@ -414,46 +1693,47 @@ class Tag(DOMElement):
 
     @property
     def stable(self):
-        if all(c.stable for c in self.childs) and self._stable:
-            self._stable = True
-            return self._stable
-        else:
-            self._stable = False
-            return self._stable
+        """True if this element has not changed since his last render."""
+        return self._clean
 
     def attr(self, attrs=None, **kwargs):
         """Add an attribute to the element"""
-        self._stable = False
+        self._invalidate()
         self.attrs.update(attrs or kwargs)
+        self._index_changed()
         return self
 
     def remove_attr(self, attr):
         """Removes an attribute."""
-        self._stable = False
+        self._invalidate()
         self.attrs.pop(attr, None)
+        self._index_changed()
         return self
 
     def add_class(self, cssclass):
         """Adds a css class to this element."""
-        self._stable = False
-        self.attrs['klass'].append(cssclass)
+        self._invalidate()
+        self.attrs['klass'] = cssclass
+        self._index_changed()
         return self
 
     def remove_class(self, cssclass):
         """Removes the given class from this element."""
-        self._stable = False
+        self._invalidate()
         self.attrs['klass'].remove(cssclass)
+        self.attrs._rendered = None
+        self._index_changed()
         return self
 
     def css(self, *props, **kwprops):
         """Adds css properties tho this element."""
-        self._stable = False
+        self._invalidate()
         styles = {}
         if props:
             if len(props) == 1 and isinstance(props[0], Mapping):
                 styles = props[0]
             elif len(props) == 2:
-                styles = dict(*props)
+                styles = {props[0]: props[1]}
             else:
                 raise TagError
         elif kwprops:
@@ -464,36 +1744,39 @@ class Tag(DOMElement):
 
     def hide(self):
         """Adds the "display: none" style attribute."""
-        self._stable = False
-        self.attrs['style']['display'] = None
+        self._invalidate()
+        self.attrs['style'] = {'display': 'none'}
         return self
 
     def show(self):
         """Removes the display style attribute."""
-        self._stable = False
-        self.attrs['style'].pop('display')
+        self._invalidate()
+        self.attrs['style'].pop('display', None)
+        self.attrs._rendered = None
         return self
 
     def toggle(self):
         """Same as jQuery's toggle, toggles the display attribute of this element."""
-        self._stable = False
-        return self.show() if self.attrs['style']['display'] == None else self.hide()
+        self._invalidate()
+        return self.show() if self.attrs.get('style', {}).get('display') == 'none' else self.hide()
 
     def data(self, key, value=None):
         """Adds extra data to this element, this data will not be rendered."""
         if value:
-            self.data[key] = value
+            if self._data is None:
+                self._data = {}
+            self._data[key] = value
             return self
         else:
-            return self.data[key]
+            return (self._data or {})[key]
 
     def has_class(self, csscl):
         """Checks if this element have the given css class."""
-        return csscl in self.attrs['klass']
+        return csscl in self.attrs.get('klass', ())
 
     def toggle_class(self, csscl):
         """Same as jQuery's toggleClass function. It toggles the css class on this element."""
-        self._stable = False
+        self._invalidate()
         return self.remove_class(csscl) if self.has_class(csscl) else self.add_class(csscl)
 
     def html(self):
@@ -501,49 +1784,227 @@ class Tag(DOMElement):
         return self._get_child_renders()
 
     def text(self):
-        """Renders the contents inside this element, without html tags."""
+        """Renders the contents inside this element, without html tags.
+        The tree is walked with an explicit stack, so the depth of the tree is not limited by the recursion limit.
+        """
         texts = []
-        for child in self.childs:
-            if isinstance(child, Tag):
-                texts.append(child.text())
-            elif isinstance(child, Content):
-                texts.append(child.render())
+        stack = [iter(self.childs)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, Tag):
+                    stack.append(iter(child.childs))
+                    break
+                elif isinstance(child, Content):
+                    texts.append(child.render())
+                else:
+                    texts.append(child)
             else:
-                texts.append(child)
+                stack.pop()
         return ''.join(texts)
 
-    def render(self, *args, **kwargs):
-        """Renders the element and all his childrens."""
-        # args kwargs API provided for last minute content injection
-        for arg in args:
-            if isinstance(arg, dict):
-                self.inject(arg)
-        if kwargs:
-            self.inject(kwargs)
+    def render(self, *args, pretty=False, indent='    ', context=None, parallel=None, **kwargs):
+        """Renders the element and all his childrens.
+        The element is compiled at the first render, if the tag or his contents are not changed
+        only the Content placeholders are rendered again.
+        With pretty, every tag containing other tags has his childs on new lines indented with indent.
+        Contents given as args and kwargs are injected in the element. Contents given in the context mapping
+        are used only for this render, as if injected in the element, leaving the tree untouched:
+        a compiled element can be rendered with different contexts from many threads at once.
+        With parallel, a number of processes or a concurrent.futures.Executor, the long childs lists are
+        splitted in chunks rendered by a process pool. Childs and contents are pickled to the workers.
+        """
+        self._inject_render_args(args, kwargs)
+        if parallel:
+            if pretty:
+                raise TagError('Parallel render is not available for the pretty render')
+            return self._render_parallel(parallel, context)
+        if pretty:
+            return self._get_pretty_plan(indent).render(root=self, context=context)
+        return self._get_plan().render(root=self, context=context)
+
+    def render_bytes(self, *args, context=None, encoding='utf-8', join=True, **kwargs):
+        """Renders the element as bytes, in the given encoding.
+        The static parts of the compiled element are encoded once, only the contents are encoded at every render.
+        If join is False returns the list of encoded chunks, to be written without joining them
+        (i.e. with socket.sendmsg or as a WSGI response body).
+        """
+        self._inject_render_args(args, kwargs)
+        chunks = self._get_plan().render_bytes(self, context, encoding)
+        return b''.join(chunks) if join else chunks
+
+    def render_many(self, contexts, sink=None, pretty=False, indent='    ', encoding='utf-8'):
+        """Renders this element once for every context of the given iterable, as render(context=context) does.
+        The element is compiled and his injected contents are resolved once for the whole batch,
+        so the tree should not be changed while the batch is rendered.
+        Without a sink returns a generator of the rendered documents. The sink can be a file-like object,
+        all the documents are written in it, or a path template formatted with each context, every document
+        is written in his own file. With a sink returns the number of documents written.
+        """
+        documents = self._render_many(contexts, pretty, indent)
+        if sink is None:
+            return (document for _, document in documents)
+        written = 0
+        for context, document in documents:
+            if hasattr(sink, 'write'):
+                sink.write(document)
+            else:
+                with open(sink.format(**context), 'w', encoding=encoding) as fp:
+                    fp.write(document)
+            written += 1
+        return written
 
-        # If the tag or his contents are not changed, we skip all the work
-        if self._stable and self._render:
-            return self._render
+    def _render_many(self, contexts, pretty, indent):
+        plan = self._get_pretty_plan(indent) if pretty else self._get_plan()
+        resolve = plan.resolver(self)
+        for context in contexts:
+            yield context, plan.fill(resolve(context))
 
+    def _get_child_renders(self):
+        text = str if self._raw_text else escape
+        return ''.join(child.render() if isinstance(child, (DOMElement, Content)) else text(child)
+                       for child in self.childs)
+
+    def _template_chunks(self, pretty=False):
+        """Returns the opening and closing static strings of this tag."""
         tag_data = {
             'tag': getattr(self, '_%s__tag' % self.__class__.__name__),
             'attrs': self.attrs.render()
         }
-        tag_data['inner'] = self._get_child_renders() if not self._void and self.childs else ''
-
-        # We declare the tag is stable and have an official render:
-        self._render = self._template.format(**tag_data)
-        self._stable = True
-        return self._render
-
-    def _get_child_renders(self):
-        return ''.join(child.render() if isinstance(child, (DOMElement, Content)) else str(child) for child in self.childs)
+        # The template is splitted around the inner placeholder in opening and closing static chunks
+        opening, _, closing = self._template.partition('{inner}')
+        return opening.format(**tag_data), closing.format(**tag_data)
+
+    def _render_parts(self, chunks=0):
+        # The stack holds the childs still to walk and the closing chunk of every open tag,
+        # compiled childs are spliced in as a whole.
+        # If chunks is given, long childs lists are splitted in that many chunks for a parallel render.
+        opening, closing = self._template_chunks()
+        yield opening
+        stack = [(self._iter_childs(self, chunks), closing, str if self._raw_text else escape)]
+        while stack:
+            childs, closing, text = stack[-1]
+            for child in childs:
+                if isinstance(child, DOMElement):
+                    if child._plan is not None and not chunks:
+                        # Spliced by _RenderPlan
+                        yield child
+                        continue
+                    opening, child_closing = child._template_chunks()
+                    yield opening
+                    stack.append((self._iter_childs(child, chunks), child_closing,
+                                  str if child._raw_text else escape))
+                    break
+                elif isinstance(child, (Content, _ParallelChunk)):
+                    yield child
+                else:
+                    yield text(child)
+            else:
+                stack.pop()
+                yield closing
+
+    def _iter_childs(self, tag, chunks):
+        if tag._void:
+            return iter(())
+        childs = tag.childs
+        if not chunks or len(childs) < self._parallel_min_childs:
+            return iter(childs)
+        size = -(-len(childs) // chunks)
+        return iter([_ParallelChunk(tag, i, i + size) for i in range(0, len(childs), size)])
+
+    def _render_parallel(self, parallel, context):
+        """Renders this element splitting the long childs lists in chunks, rendered by a process pool.
+        Parallel is the number of worker processes or an Executor to use.
+        Where available, new worker processes are forked to inherit the tree, otherwise the chunks are pickled.
+        Forking a process with other threads running can deadlock the workers, so it's done only if this
+        is the only thread, i.e. not in a threaded server.
+        """
+        forked = not isinstance(parallel, Executor) and 'fork' in get_all_start_methods() \
+            and threading.active_count() == 1
+        if isinstance(parallel, Executor):
+            pool, workers = parallel, os.cpu_count() or 1
+        else:
+            workers = parallel
+            method = 'fork' if forked else self._pool_start_method()
+            pool = ProcessPoolExecutor(workers, mp_context=get_context(method))
+        # A few chunks per worker balance the load between uneven chunks
+        plan = _RenderPlan(self._render_parts(chunks=workers * 4), owner=self)
+        parts = plan.parts[:]
+        futures = []
+        key = id(self)
+        if forked:
+            _forked_roots[key] = self
+        try:
+            for (i, hole), value in zip(plan.holes, plan.resolve(self, context)):
+                if not isinstance(hole, _ParallelChunk):
+                    parts[i] = hole._render_value(value)
+                elif forked:
+                    path = []
+                    node = hole.parent
+                    while node is not self:
+                        path.append(node._own_index)
+                        node = node.parent
+                    used = {name: context[name] for name in hole.names() if name in context} if context else None
+                    futures.append((i, pool.submit(_render_forked_chunk, key, path[::-1],
+                                                   hole.start, hole.stop, used)))
+                else:
+                    futures.append((i, pool.submit(_render_pickled_chunk, pickle.dumps(hole.childs, -1), value,
+                                                   hole.parent._raw_text)))
+            for i, future in futures:
+                parts[i] = future.result()
+        finally:
+            _forked_roots.pop(key, None)
+            if pool is not parallel:
+                pool.shutdown()
+        return ''.join(parts)
+
+    @staticmethod
+    def _pool_start_method():
+        """Start method of the worker processes when forking is not safe: forkserver where available,
+        it forks the workers from a single threaded server process, otherwise spawn.
+        """
+        return 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+
+    def _pretty_parts(self, prefix, indent):
+        stack = []
+        node = self
+        while node is not None:
+            opening, closing = node._template_chunks(pretty=True)
+            yield opening
+            if node._void:
+                yield closing
+            elif not any(isinstance(child, DOMElement) or isinstance(child, Content) and child._template
+                         for child in node.childs):
+                # Text only tags are rendered inline
+                text = str if node._raw_text else escape
+                for child in node.childs:
+                    yield child if isinstance(child, Content) else text(child)
+                yield closing
+            else:
+                stack.append((iter(node.childs), '\n' + prefix + closing, prefix + indent,
+                              str if node._raw_text else escape))
+            # Resume the walk from the innermost open tag
+            node = None
+            while stack and node is None:
+                childs, closing, inner, text = stack[-1]
+                for child in childs:
+                    if isinstance(child, Content):
+                        yield _IndentedContent(child, inner, indent)
+                        continue
+                    yield '\n' + inner
+                    if isinstance(child, DOMElement):
+                        node, prefix = child, inner
+                        break
+                    yield text(child)
+                else:
+                    stack.pop()
+                    yield closing
 
 
 class VoidTag(Tag):
     """
     A void tag, as described in W3C reference: https://www.w3.org/TR/html51/syntax.html#void-elements
     """
+    __slots__ = ()
     _void = True
     _template = '<{tag}{attrs}/>'
 
@@ -554,17 +2015,19 @@ class Content:
     At render time, a content with the same name is searched in parents, the nearest one is used.
     If no content with the same name is used, an empty string is rendered.
     If instantiated with the named attribute content, this will override all the content injection on parents.
+    Contents are html escaped at render time, use tempy.Markup to insert html code as it is.
     """
+    __slots__ = ('parent', '_name', '_fixed_content', '_template', 'uuid', 'stable')
+
     def __init__(self, name=None, content=None, template=None):
         super().__init__()
         self.parent = None
-        self._tab_count = 0
         if not name and not content:
             raise TagError
         self._name = name
         self._fixed_content = content
         self._template = template
-        self.uuid = uuid4()
+        self.uuid = _new_uid()
         self.stable = False
 
     def __repr__(self):
@@ -578,35 +2041,117 @@ class Content:
     def __copy__(self):
         return self.__class__(self._name, self._fixed_content, self._template)
 
+    def __getstate__(self):
+        return self._name, self._fixed_content, self._template
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
     @property
     def content(self):
-        content = self._fixed_content or self.parent._find_content(self._name)
-        if content:
-            if type(content) in (list, tuple, GeneratorType) or (isinstance(content, Iterable) and content is not str):
-                return list(content)
-            elif type(content) in (MappingProxyType, ):
-                return list(content.values())
+        return list(self._items(self._get_content()))
+
+    def _get_content(self):
+        return self._fixed_content or self.parent._find_content(self._name)
+
+    def _resolve(self, scope):
+        """Returns this placeholder's content, searching it in the given scope."""
+        return self._fixed_content or scope.get(self._name, '')
+
+    @staticmethod
+    def _items(content):
+        """Returns the given content as an iterable of items, generators are returned unconsumed."""
+        if content is not None and content != '':
+            if type(content) in (MappingProxyType, ):
+                return content.values()
+            elif type(content) in (list, tuple, GeneratorType) or \
+                    (isinstance(content, Iterable) and not isinstance(content, str)):
+                return content
             else:
                 return (content, )
         else:
-            raise StopIteration
+            return ()
 
     @property
     def length(self):
         return len(self.content)
 
-    def render(self, pretty=False):
-        ret = []
-        for content in self.content:
+    def render(self, pretty=False, indent='    '):
+        return self._render_value(self._get_content(), '' if pretty else None, indent)
+
+    async def render_async(self, pretty=False, indent='    '):
+        """Renders this content, awaiting it if the content is a coroutine or an async iterable."""
+        return self._render_value(await self._await_content(self._get_content()), '' if pretty else None, indent)
+
+    @staticmethod
+    def _is_async(content):
+        return isawaitable(content) or hasattr(content, '__aiter__')
+
+    @staticmethod
+    async def _await_content(content):
+        if isawaitable(content):
+            content = await content
+        if hasattr(content, '__aiter__'):
+            content = [item async for item in content]
+        return content
+
+    def _render_value(self, content, prefix=None, indent='    ', raw=None):
+        """Renders the given content value, if a prefix is given items are rendered on lines indented by prefix.
+        Values are not escaped if raw, by default if the parent is a raw text element.
+        """
+        rendered = self._iter_contents(self._items(content), prefix=prefix, indent=indent, raw=raw)
+        if prefix is None:
+            return ''.join(rendered)
+        return ('\n' + prefix).join(rendered)
+
+    def render_iter(self):
+        """Yields the render of this content item by item, generator contents are consumed lazily."""
+        return self._iter_contents(self._items(self._get_content()), stream=True)
+
+    def _iter_contents(self, contents, stream=False, prefix=None, indent='    ', raw=None):
+        plan = None
+        if raw is None:
+            raw = self.parent is not None and self.parent._raw_text
+        text = str if raw else escape
+        for content in contents:
             if isinstance(content, DOMElement):
-                ret.append(content.render(pretty))
-            else:
-                if self._template:
-                    self._template.inject(content)
-                    ret.append(self._template.inject(content).render())
+                if stream:
+                    yield from content.render_iter()
+                elif prefix is not None:
+                    yield _RenderPlan(content._pretty_parts(prefix, indent)).render(root=content)
                 else:
-                    ret.append(str(content))
-        return ''.join(ret)
+                    yield content.render()
+            elif self._template:
+                # The template is compiled once, every item only fills the template's placeholders
+                if plan is None:
+                    plan = self._template_plan() if prefix is None else \
+                        _RenderPlan(self._template._pretty_parts(prefix, indent))
+                yield plan.render(content)
+            else:
+                yield text(content)
+
+    def _template_plan(self):
+        return self._template._get_plan()
+
+    def _template_key(self):
+        """Returns the template's plan and the contents injected in and above the template's elements,
+        the template items fall back to them: injection does not drop the plans, so both are part of the cache keys.
+        The keys of the templates of the contents in the template are included too.
+        """
+        plan = self._template_plan()
+        template = self._template
+        elements, _ = plan._get_scopes(template)
+        maps = plan._root_maps(template) + [node._content_data for node, _ in elements if node._content_data]
+        nested = tuple(content._template_key() for _, content in plan.holes if content._template)
+        return plan, tuple(_cache_key(data) for data in maps), nested
+
+    def _fill(self, values, prefix=None, indent='    '):
+        """Renders this placeholder searching the content in the given values before than in the parents.
+        Used to render template items without injecting them in the template.
+        """
+        if not self._fixed_content and isinstance(values, Mapping) and self._name in values:
+            return self._render_value(values[self._name], prefix, indent)
+        return self._render_value(self._get_content(), prefix, indent)
 
 
 class Css(Tag):
@@ -622,9 +2167,13 @@ class Css(Tag):
             }
         },
         '#myid': {'color': 'blue'}
-    }
+    })
     translates to:
     <style>
+    #myid {
+        color: blue;
+    }
+
     html body {
         color: red;
     }
@@ -633,33 +2182,111 @@ class Css(Tag):
         color: green;
         border: 1px;
     }
-    #myid {
-        'color': 'blue';
-    }
     </style>
+    The default render is minified:
+    <style>#myid{color:blue}html body{color:red}html body div{color:green;border:1px}</style>
+    Values can be strings, numbers or callables returning the value, nested mappings are nested selectors.
+
+    The compiled css is cached, one for the minified render and one for every pretty indentation,
+    until the rules are changed with the .attr api.
     """
+    __slots__ = ('_compiled', )
     _template = '<style>{css}</style>'
 
-    def render(self, *args, **kwargs):
-        pretty = kwargs.pop('pretty', False)
-        result = []
-        nodes_to_parse = [([], self.attrs)]
-
-        while nodes_to_parse:
-            parents, node = nodes_to_parse.pop(0)
-            if parents:
-                result.append("%s { " % " ".join(parents))
-            else:
-                parents = []
+    def __init__(self, *args, **kwargs):
+        super().__init__(**kwargs)
+        for rules in args:
+            self.attr(rules)
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._compiled = None
 
+    def _copy(self):
+        new = super()._copy()
+        new._compiled = dict(self._compiled) if self._compiled else None
+        return new
+
+    def _invalidate(self):
+        self._compiled = None
+        super()._invalidate()
+
+    def render(self, *args, pretty=False, indent='    ', **kwargs):
+        return self._template.format(css=self.stylesheet(pretty, indent))
+
+    def stylesheet(self, pretty=False, indent='    '):
+        """Returns the compiled css without the style tag, i.e. to be served as an external stylesheet."""
+        key = indent if pretty else None
+        if self._compiled is None:
+            self._compiled = {}
+        css = self._compiled.get(key)
+        if css is None:
+            css = self._compiled[key] = self._compile(key)
+        return css
+
+    @classmethod
+    def extract(cls, *trees, css=None, prefix='s-'):
+        """Moves the inline style attributes found in the given trees in a shared stylesheet.
+        Every style is replaced by a class named after the hash of its declarations, so identical styles
+        share the same rule and the names are the same in every process: pages rendered in different
+        batches can link the same external stylesheet.
+        The rules are added to the given Css element, or to a new one, that is returned.
+        Inline styles override the other css rules, while the extracted classes do not.
+        """
+        if css is None:
+            css = cls()
+        classes = {}
+        stack = list(reversed(trees))
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Content):
+                if isinstance(node._template, DOMElement):
+                    stack.append(node._template)
+                continue
+            if not isinstance(node, DOMElement) or isinstance(node, Css):
+                continue
+            stack.extend(reversed(node.childs))
+            style = node.attrs.get('style') if isinstance(node, Tag) else None
+            if not style:
+                continue
+            # Property names are unique in a style, sorting them makes the order of the declarations irrelevant
+            declarations = tuple(sorted((k, str(v)) for k, v in style.items()))
+            name = classes.get(declarations)
+            if name is None:
+                digest = blake2b(repr(declarations).encode('utf-8'), digest_size=8).hexdigest()
+                name = classes[declarations] = prefix + digest
+            node.remove_attr('style')
+            node.add_class(name)
+        if classes:
+            css.attr({'.' + name: dict(declarations) for declarations, name in classes.items()})
+        return css
+
+    def _compile(self, indent=None):
+        """Flattens the nested rules in a stylesheet, selectors are listed breadth first.
+        Selectors with no declarations are not rendered. With no indent the css is minified.
+        """
+        rules = []
+        nodes = deque((((), self.attrs), ))
+        while nodes:
+            selector, node = nodes.popleft()
+            declarations = []
             for key, value in node.items():
-                if value.__class__.__name__ in ('str', 'unicode'):
-                    result.append('%s: %s; %s' % (key, value, "\n" if pretty else ""))
-                elif value.__class__.__name__ == 'function':
-                    result.append('%s: %s; %s' % (key, value(), "\n" if pretty else ""))
-                elif value.__class__.__name__ == 'dict':
-                    nodes_to_parse.append(([p for p in parents] + [key], value))
-            if result:
-                result.append("}" + "\n\n" if pretty else "")
-
-        return self._template.format(css=''.join(result))
+                if isinstance(value, Mapping):
+                    nodes.append((selector + (key, ), value))
+                    continue
+                if callable(value):
+                    value = value()
+                if value is not None:
+                    declarations.append((key, value))
+            if selector and declarations:
+                if indent is None:
+                    rules.append('%s{%s}' % (' '.join(selector), ';'.join('%s:%s' % d for d in declarations)))
+                else:
+                    rules.append('%s {\n%s}\n' % (
+                        ' '.join(selector), ''.join('%s%s: %s;\n' % ((indent, ) + d) for d in declarations)))
+        if indent is None:
+            return ''.join(rules)
+        return '\n%s' % '\n'.join(rules)
+
+    def _template_chunks(self, pretty=False):
+        return self.render(pretty=pretty), ''
@@ -5,7 +5,7 @@
 import unittest
 
 from tempy.tags import *
-from tempy.tempy import DOMElement, Tag, TagAttrs
+from tempy.tempy import DOMElement, Tag, TagAttrs, Content
 
 
 class TestTag(unittest.TestCase):
@@ -18,5 +18,31 @@ class TestTag(unittest.TestCase):
         self.assertIsInstance(tag, DOMElement)
         self.assertIsInstance(tag.attrs, TagAttrs)
 
+    def test_template_list(self):
+        template = Div(klass='item')(B()(Content('name')), P()('age:', Content('age')))
+        self.page(Content('items', template=template))
+        items = [{'name': 'Luke', 'age': 19}, {'name': 'Leia', 'age': 19}, {'name': 'Yoda', 'age': 900}]
+        expected = ''.join('<div class="item"><b>%s</b><p>age:%s</p></div>' % (i['name'], i['age'])
+                           for i in items)
+        self.assertEqual(self.page.render(items=items), '<html>%s</html>' % expected)
+        # The shared template is never injected with the items data
+        self.assertEqual(template.content_data, {})
+        self.assertIsNotNone(template._plan)
+
+    def test_template_fallback(self):
+        template = Div()(Content('name'), Content('suffix'))
+        template.inject(suffix='!')
+        self.page(Content('items', template=template))
+        self.assertEqual(self.page.render(items=[{'name': 'a'}, {'name': 'b', 'suffix': '?'}]),
+                         '<html><div>a!</div><div>b?</div></html>')
+
+    def test_template_changed(self):
+        template = Div()(Content('name'))
+        self.page(Content('items', template=template))
+        self.page.render(items=[{'name': 'a'}])
+        template.attr(id='new')
+        self.assertEqual(self.page.render(items=[{'name': 'a'}]), '<html><div id="new">a</div></html>')
+
+
 if __name__ == '__main__':
     unittest.main()
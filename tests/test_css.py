@@ -5,7 +5,7 @@
 import unittest
 
 from tempy.tags import *
-from tempy.tempy import DOMElement, Tag, TagAttrs
+from tempy.tempy import DOMElement, Tag, TagAttrs, Content, Css
 
 
 class TestTag(unittest.TestCase):
@@ -18,5 +18,78 @@ class TestTag(unittest.TestCase):
         self.assertIsInstance(tag, DOMElement)
         self.assertIsInstance(tag.attrs, TagAttrs)
 
+    def test_render(self):
+        css = Css({'html': {'body': {'color': 'red', 'div': {'color': 'green', 'border': '1px'}}},
+                   '#myid': {'color': 'blue', 'z-index': 2, 'width': lambda: '10px'}})
+        self.is_tag(css)
+        self.assertEqual(css.render(), '<style>#myid{color:blue;z-index:2;width:10px}html body{color:red}'
+                                       'html body div{color:green;border:1px}</style>')
+        self.assertEqual(css.render(pretty=True, indent='  '), '\n'.join((
+            '<style>',
+            '#myid {',
+            '  color: blue;',
+            '  z-index: 2;',
+            '  width: 10px;',
+            '}',
+            '',
+            'html body {',
+            '  color: red;',
+            '}',
+            '',
+            'html body div {',
+            '  color: green;',
+            '  border: 1px;',
+            '}',
+            '</style>')))
+        self.assertEqual(Css().render(), '<style></style>')
+        self.page(Head()(css))
+        self.assertEqual(self.page.render(), '<html><head>%s</head></html>' % css.render())
+
+    def test_compiled_cache(self):
+        css = Css({'.c%d' % i: {'margin': '%dpx' % i, 'a': {'color': 'red'}} for i in range(5000)})
+        minified = css.stylesheet()
+        self.assertEqual(minified.count('{'), 10000)
+        self.assertEqual(css.render(), '<style>%s</style>' % minified)
+        self.assertIs(css.stylesheet(), minified)
+        pretty = css.stylesheet(pretty=True)
+        self.assertIs(css.stylesheet(pretty=True), pretty)
+        self.assertNotEqual(css.stylesheet(pretty=True, indent='\t'), pretty)
+        self.assertIs(css.stylesheet(), minified)
+        css.attr({'#new': {'color': 'blue'}})
+        self.assertIn('.c4999{margin:4999px}#new{color:blue}.c0 a{color:red}', css.render())
+        self.assertIn('#new {\n    color: blue;\n}', css.render(pretty=True))
+        copied = css.clone()
+        css.attr({'#other': {'color': 'red'}})
+        self.assertNotIn('#other', copied.render())
+
+    def test_extract(self):
+        rows = [Tr()(Td().css(color='red', width='10px')(i), Td().css(color='blue')) for i in range(100)]
+        template = Li().css(color='red', width='10px')(Content('name'))
+        table = Table()(rows)
+        other = Div(klass='box').css('color', 'blue')(Ul()(Content('items', template=template)), Css({'p': {'a': 'b'}}))
+        expected = table.render()
+        css = Css.extract(table, other)
+        self.assertEqual(len(css.attrs), 2)
+        red, blue = (rule[1:] for rule in css.attrs)
+        self.assertTrue(red.startswith('s-'))
+        self.assertEqual(css.stylesheet(), '.%s{color:red;width:10px}.%s{color:blue}' % (red, blue))
+        self.assertNotIn('style', table.render())
+        self.assertEqual(table.render(), expected.replace(
+            '<td style="color: red; width: 10px;">', '<td class="%s">' % red).replace(
+            '<td style="color: blue;">', '<td class="%s">' % blue))
+        self.assertEqual(other.attrs['klass'], ['box', blue])
+        self.assertIn('<li class="%s">a</li>' % red, other.render(items=[{'name': 'a'}]))
+        # The names are the same for every batch
+        shared = Css.extract(Div().css(color='blue'), css=Css())
+        self.assertEqual(list(shared.attrs), ['.' + blue])
+        self.assertEqual(Css.extract(Div()).render(), '<style></style>')
+
+    def test_extract_declarations_order(self):
+        first, second = Div().css(color='red', width='1px'), Div().css(width='1px', color='red')
+        css = Css.extract(first, second)
+        self.assertEqual(len(css.attrs), 1)
+        self.assertEqual(first.attrs['klass'], second.attrs['klass'])
+
+
 if __name__ == '__main__':
     unittest.main()
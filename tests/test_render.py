@@ -2,10 +2,20 @@
 """
 @author: Federico Cerchiari <federicocerchiari@gmail.com>
 """
+import asyncio
+import io
+import os
+import pickle
+import sys
+import tempfile
+import threading
 import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from tempy.tags import *
-from tempy.tempy import DOMElement, Tag, TagAttrs
+from tempy.tempy import DOMElement, Tag, TagAttrs, Content
+from tempy.exceptions import TagError
+from tempy.markup import Markup, escape
 
 
 class TestTag(unittest.TestCase):
@@ -18,6 +28,424 @@ class TestTag(unittest.TestCase):
         self.assertIsInstance(tag, DOMElement)
         self.assertIsInstance(tag.attrs, TagAttrs)
 
+    def build_page(self):
+        return self.page(
+            Head()(Title()('Title')),
+            Body()(
+                Div(klass='container', id='main')(
+                    'Some text', Br(), P()(Content('name')), Comment('a comment')
+                )
+            )
+        )
+
+    def test_compile_static(self):
+        page = self.page(Head(), Body()(Div()('static')))
+        expected = page.render()
+        page.compile()
+        self.assertEqual(page._plan.parts, [expected])
+        self.assertEqual(page.render(), expected)
+
+    def test_compile_content_holes(self):
+        page = self.build_page()
+        expected = page.render(name='foo')
+        page.compile()
+        self.assertEqual(len(page._plan.parts), 3)
+        self.assertEqual(len(page._plan.holes), 1)
+        self.assertEqual(page.render(), expected)
+        self.assertIn('<p>bar</p>', page.render(name='bar'))
+
+    def test_content_scopes(self):
+        inner = Div()(Content('a'), Content('b'), Content('a', content='fixed'))
+        outer = Div()(inner, Span()(Content('a')))
+        page = Body()(outer)
+        page.inject(a='root', b='root_b')
+        self.assertEqual(page.render(), '<body><div><div>rootroot_bfixed</div><span>root</span></div></body>')
+        # Nearest injections win, injecting does not recompile the plan
+        plan = page._plan
+        inner.inject(a='inner')
+        self.assertEqual(page.render(), '<body><div><div>innerroot_bfixed</div><span>root</span></div></body>')
+        outer.inject(b='outer')
+        self.assertEqual(page.render(), '<body><div><div>innerouterfixed</div><span>root</span></div></body>')
+        self.assertIs(page._plan, plan)
+        # Contents injected above the rendered element are found too
+        self.assertEqual(outer.render(), '<div><div>innerouterfixed</div><span>root</span></div>')
+        self.assertEqual(''.join(page.render_iter()), page.render())
+
+    def test_compile_dropped_on_change(self):
+        page = self.build_page().compile()
+        page[1][0].attr(id='other')
+        self.assertIsNone(page._plan)
+        self.assertIn('id="other"', page.render())
+        page.compile()
+        page[1].pop()
+        self.assertIsNone(page._plan)
+        self.assertEqual(page.compile().render(), '<html><head><title>Title</title></head><body></body></html>')
+
+    def test_incremental_render(self):
+        rows = [Tr()(Td()(i), Td()(Content('value'))) for i in range(10)]
+        table = Table()(Tbody()(rows))
+        self.page(Body()(table))
+        first = self.page.render(value='v')
+        self.assertTrue(self.page.stable)
+        plans = [row._plan for row in rows]
+        # Static subtrees keep their render only
+        self.assertEqual(rows[0][0]._plan, '<td>0</td>')
+        rows[5][0].attr(klass='changed')
+        self.assertFalse(rows[5].stable)
+        self.assertFalse(self.page.stable)
+        self.assertTrue(rows[4].stable)
+        second = self.page.render()
+        self.assertEqual(second, first.replace('<td>5</td>', '<td class="changed">5</td>'))
+        # Only the changed cell ancestors are compiled again
+        for i, row in enumerate(rows):
+            if i == 5:
+                self.assertIsNot(row._plan, plans[i])
+            else:
+                self.assertIs(row._plan, plans[i])
+        # Injection does not invalidate the cached plans
+        self.assertIn('<td>w</td>', self.page.render(value='w'))
+        self.assertIs(rows[0]._plan, plans[0])
+
+    def test_render_cache(self):
+        template = Li()(Content('name'))
+        page = self.page(Body()(H1()(Content('title')), Ul()(Content('items', template=template))))
+        page.render_cache(maxsize=16)
+        items = [{'name': 'a'}, {'name': 'b'}]
+        first = page.render(title='T', items=items)
+        self.assertEqual(page.cache_info().hits, 0)
+        self.assertEqual(page.render(title='T', items=[dict(i) for i in items]), first)
+        self.assertEqual(page.cache_info().hits, 1)
+        # Same items with a different title: the items fragment is reused
+        self.assertIn('<h1>U</h1>', page.render(title='U'))
+        info = page.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 5))
+        # A change in the template is not served from the cache
+        template.attr(klass='x')
+        self.assertIn('<li class="x">a</li>', page.render())
+        # Generators can't be cached, but are rendered
+        self.assertIn('<li class="x">c</li>', page.render(items=({'name': n} for n in 'c')))
+        page[0].attr(id='body')
+        self.assertEqual(page.cache_info().currsize, 0)
+
+    def test_render_cache_template_injection(self):
+        template = Li()(Content('name'), Span()(Content('suffix')))
+        template.inject(suffix='!')
+        page = Ul()(Content('items', template=template), Content('other')).render_cache(16)
+        items = [{'name': 'a'}]
+        self.assertEqual(page.render(items=items), '<ul><li>a<span>!</span></li></ul>')
+        # Contents injected in the template are not served from the cache
+        template.inject(suffix='?')
+        self.assertEqual(page.render(items=items), '<ul><li>a<span>?</span></li></ul>')
+        template[1].inject(suffix='.')
+        self.assertEqual(page.render(items=items), '<ul><li>a<span>.</span></li></ul>')
+        # Only the other content is served from the cache, then the whole render
+        self.assertEqual(page.cache_info().hits, 2)
+        self.assertEqual(page.render(items=items), '<ul><li>a<span>.</span></li></ul>')
+        self.assertEqual(page.cache_info().hits, 3)
+
+    def test_render_cache_nested_templates(self):
+        inner = Span()(Content('x'))
+        outer = Li()(Content('sub', template=inner))
+        page = Ul()(Content('items', template=outer), Content('other')).render_cache(16)
+        items = [{'sub': [{'x': 1}]}]
+        self.assertEqual(page.render(items=items), '<ul><li><span>1</span></li></ul>')
+        inner.attr(id='z')
+        self.assertEqual(page.render(items=items), '<ul><li><span id="z">1</span></li></ul>')
+        inner.inject(y='unused')
+        inner(Content('y'))
+        self.assertEqual(page.render(items=items), '<ul><li><span id="z">1unused</span></li></ul>')
+        inner.inject(y='changed')
+        self.assertEqual(page.render(items=items), '<ul><li><span id="z">1changed</span></li></ul>')
+
+    def test_render_cache_policies(self):
+        for policy, expected_hits in (('lru', 2), ('fifo', 1)):
+            div = Div()(Content('value')).render_cache(maxsize=2, policy=policy)
+            for value in ('a', 'b', 'a', 'c', 'a'):
+                div.render(value=value)
+            self.assertEqual(div.cache_info().hits, expected_hits)
+        self.assertRaises(TagError, Div().render_cache, policy='random')
+
+    def test_escaping(self):
+        self.assertEqual(escape('<a href="x">&\'</a>'), '&lt;a href=&quot;x&quot;&gt;&amp;&#x27;&lt;/a&gt;')
+        self.assertEqual(escape(Markup('<b>')), '<b>')
+        self.assertEqual(escape(5), '5')
+        div = Div(title='"quoted"')('<i>', Markup('<b>safe</b>'), Content('user'))
+        self.assertEqual(div.render(user='<script>'),
+                         '<div title="&quot;quoted&quot;">&lt;i&gt;<b>safe</b>&lt;script&gt;</div>')
+        self.assertIn('<em>', div.render(user=Markup('<em>')))
+        template = Li()(Content('name'))
+        ul = Ul()(Content('items', template=template))
+        self.assertEqual(ul.render(items=[{'name': 'a&b'}]), '<ul><li>a&amp;b</li></ul>')
+
+    def test_raw_text_script(self):
+        code = 'if (a && b < c) { x = "y"; }'
+        script = Script()(code, Content('more'))
+        expected = '<script>%s%s</script>' % (code, '<b>')
+        self.assertEqual(script.render(more='<b>'), expected)
+        self.assertEqual(''.join(script.render_iter(more='<b>')), expected)
+        self.assertEqual(Script()(code)._get_child_renders(), code)
+        self.assertEqual(Div()(code, script).render(more='<b>'), '<div>%s%s</div>' % (escape(code), expected))
+        self.assertEqual(Body()(script).render(pretty=True, more='<b>'),
+                         '<body>\n    %s\n</body>' % expected)
+        self.assertEqual(Script()(Content('code')).render(context={'code': code}), '<script>%s</script>' % code)
+
+    def test_raw_text_style(self):
+        css = 'a > b { content: "&"; }'
+        style = Style()(css)
+        self.assertEqual(style.render(), '<style>%s</style>' % css)
+        self.assertEqual(Head()(style, Title()('a > b')).render(),
+                         '<head><style>%s</style><title>a &gt; b</title></head>' % css)
+        self.assertEqual(Head()(Style()('a > b', P())).render(pretty=True),
+                         '<head>\n    <style>\n        a > b\n        <p></p>\n    </style>\n</head>')
+
+    def test_pretty(self):
+        page = self.page(
+            Head()(Title()('Title')),
+            Body()(Div(klass='box')('text', Br()), Ul()(Content('items', template=Li()(Content('name')))))
+        )
+        compact = page.render(items=[{'name': 'a'}, {'name': 'b'}])
+        plan = page._plan
+        self.assertEqual(page.render(pretty=True), '\n'.join((
+            '<html>',
+            '    <head>',
+            '        <title>Title</title>',
+            '    </head>',
+            '    <body>',
+            '        <div class="box">',
+            '            text',
+            '            <br/>',
+            '        </div>',
+            '        <ul>',
+            '            <li>a</li>',
+            '            <li>b</li>',
+            '        </ul>',
+            '    </body>',
+            '</html>')))
+        self.assertIn('\n  <head>\n    <title>', page.render(pretty=True, indent='  '))
+        # The compact plan is kept apart from the pretty one
+        self.assertIs(page._plan, plan)
+        self.assertEqual(page.render(), compact)
+        page[0].attr(id='head')
+        self.assertIsNone(page._pretty)
+        self.assertIn('<head id="head">', page.render(pretty=True))
+
+    def test_deep_tree(self):
+        root = leaf = Div()
+        for _ in range(50000):
+            child = Div()
+            leaf(child)
+            leaf = child
+        leaf(Content('deep'))
+        root.inject(deep='bottom')
+        expected = '<div>' * 50001 + 'bottom' + '</div>' * 50001
+        self.assertEqual(root.render(), expected)
+        self.assertEqual(''.join(root.render_iter()), expected)
+        leaf(Span())
+        self.assertEqual(root.render(), expected.replace('bottom', 'bottom<span></span>'))
+        self.assertTrue(root.stable)
+        self.assertEqual(root.render(pretty=True, indent=''),
+                         '<div>\n' * 50001 + 'bottom\n<span></span>' + '\n</div>' * 50001)
+        self.assertEqual(root.text(), 'bottom')
+        copied = pickle.loads(pickle.dumps(root, -1))
+        self.assertEqual(copied.render(), root.render())
+
+    def test_render_context(self):
+        page = self.page(Body()(
+            H1()(Content('title')),
+            Ul()(Content('items', template=Li()(Content('name')))),
+            Div()(Content('title'))
+        )).compile()
+        page.render_cache(16)
+
+        def render(n):
+            context = {'title': 'page %d' % n, 'items': [{'name': 'item %d.%d' % (n, i)} for i in range(n % 5)]}
+            items = ''.join('<li>item %d.%d</li>' % (n, i) for i in range(n % 5))
+            expected = '<html><body><h1>page %d</h1><ul>%s</ul><div>page %d</div></body></html>' % (n, items, n)
+            for _ in range(20):
+                self.assertEqual(page.render(context=context), expected)
+                self.assertEqual(''.join(page.render_iter(context=context)), expected)
+            return n
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with ThreadPoolExecutor(8) as pool:
+                self.assertEqual(list(pool.map(render, range(200))), list(range(200)))
+        finally:
+            sys.setswitchinterval(interval)
+        # The shared template is left untouched
+        self.assertIsNone(page._content_data)
+        self.assertTrue(page.stable)
+        self.assertEqual(page.render(), '<html><body><h1></h1><ul></ul><div></div></body></html>')
+        page.inject(title='injected')
+        self.assertIn('<h1>context</h1>', page.render(context={'title': 'context'}))
+        self.assertIn('<h1>injected</h1>', page.render())
+
+    def test_render_many(self):
+        page = self.page(Body()(
+            H1()(Content('title')),
+            Div()(P()(Content('title')), Content('sub')).inject(sub='inner'),
+            Ul()(Content('items', template=Li()(Content('item'))))
+        ))
+        page.inject(title='default', sub='outer')
+        contexts = [{'id': i, 'title': 'page %d' % i, 'sub': 'ignored', 'items': [{'item': i}]} for i in range(3)]
+        expected = [page.render(context=context) for context in contexts]
+        self.assertEqual(list(page.render_many(iter(contexts))), expected)
+        self.assertIn('<h1>default</h1><div><p>default</p>inner</div>', list(page.render_many([{}]))[0])
+        self.assertEqual(list(page.render_many(contexts, pretty=True)),
+                         [page.render(context=context, pretty=True) for context in contexts])
+        self.assertEqual(page.content_data, {'title': 'default', 'sub': 'outer'})
+        sink = io.StringIO()
+        self.assertEqual(page.render_many(contexts, sink=sink), 3)
+        self.assertEqual(sink.getvalue(), ''.join(expected))
+        with tempfile.TemporaryDirectory() as path:
+            self.assertEqual(page.render_many(iter(contexts), sink=os.path.join(path, '{id}.html')), 3)
+            for i in range(3):
+                with open(os.path.join(path, '%d.html' % i), encoding='utf-8') as fp:
+                    self.assertEqual(fp.read(), expected[i])
+
+    def test_render_parallel(self):
+        rows = [Tr(klass='row')(Td()(i), Td()(Content('value')), Td()(Content('own'))) for i in range(600)]
+        for i, row in enumerate(rows):
+            row.inject(own='own %d' % i)
+        page = self.page(Body()(H1()(Content('title')), Table()(rows)))
+        page.inject(value='<v>')
+        expected = page.render(title='serial')
+        self.assertEqual(page.render(parallel=2), expected)
+        self.assertEqual(page.render(parallel=2, context={'value': 'ctx'}), page.render(context={'value': 'ctx'}))
+        # Chunks are pickled to the workers of a given executor
+        with ProcessPoolExecutor(2) as pool:
+            self.assertEqual(page.render(parallel=pool), expected)
+        # With other threads running the workers are not forked, the chunks are pickled
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        try:
+            self.assertEqual(page.render(parallel=2), expected)
+        finally:
+            stop.set()
+            thread.join()
+        with self.assertRaises(TagError):
+            page.render(parallel=2, pretty=True)
+
+    def test_render_parallel_used_contents(self):
+        # Only the contents used by a chunk are sent to the workers, a generator used elsewhere is not pickled
+        page = self.page(Body()(Ul()(Content('nav', template=Li()(Content('name')))),
+                                Div()([P()(Content('text')) for _ in range(600)])))
+        page.inject(text='t')
+
+        def nav():
+            return {'nav': ({'name': n} for n in 'ab')}
+        expected = page.render(context=nav())
+        self.assertIn('<ul><li>a</li><li>b</li></ul>', expected)
+        self.assertEqual(page.render(parallel=2, context=nav()), expected)
+        with ProcessPoolExecutor(2) as pool:
+            self.assertEqual(page.render(parallel=pool, context=nav()), expected)
+
+    def test_pickle(self):
+        div = Div(klass='a', id='d')(P()('text'), Content('value'), named=Span())
+        div.inject(value='v')
+        copied = pickle.loads(pickle.dumps(Body()(div)[0]))
+        self.assertIsNone(copied.parent)
+        self.assertEqual(copied.attrs['klass'], ['a'])
+        self.assertIs(copied.named, copied[2])
+        self.assertIs(copied[1].parent, copied)
+        self.assertEqual(copied.render(), div.render())
+
+    def test_render_bytes(self):
+        page = self.page(Body()(H1(klass='tïtle')('Tèmpy'), P()(Content('text'))))
+        self.assertEqual(page.render_bytes(text='<ü>'), page.render().encode('utf-8'))
+        plan = page._plan
+        chunks = page.render_bytes(context={'text': 'ctx'}, join=False)
+        self.assertEqual(b''.join(chunks), page.render(context={'text': 'ctx'}).encode('utf-8'))
+        # Static chunks are encoded once
+        self.assertIs(chunks[0], page.render_bytes(join=False)[0])
+        self.assertIs(page._plan, plan)
+        self.assertEqual(page.render_bytes(encoding='latin-1'), page.render().encode('latin-1'))
+        self.assertEqual(Div()('static').render_bytes(), b'<div>static</div>')
+
+    def test_render_to(self):
+        page = self.page(Body()(Div()(P()('àè %d' % i) for i in range(100)), Div()(Content('value'))))
+        page.inject(value='ünïcode')
+
+        class Sink:
+            writes = []
+            write = writes.append
+
+        # Not compiled trees are written as they are walked
+        page.render_to(Sink, buffer_size=100)
+        self.assertFalse(page.stable)
+        self.assertGreater(len(Sink.writes), 10)
+        self.assertTrue(all(len(data) < 200 for data in Sink.writes))
+        expected = page.render()
+        self.assertEqual(''.join(Sink.writes), expected)
+        fp = io.StringIO()
+        self.assertIs(page.render_to(fp), page)
+        self.assertEqual(fp.getvalue(), expected)
+        fp = io.BytesIO()
+        page.render_to(fp, context={'value': 'ctx'}, encoding='utf-8')
+        self.assertEqual(fp.getvalue().decode('utf-8'), page.render(context={'value': 'ctx'}))
+
+    def test_render_iter(self):
+        page = self.build_page()
+        expected = page.render(name='foo')
+        chunks = list(page.render_iter(name='foo'))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), expected)
+        page.compile()
+        self.assertEqual(''.join(page.render_iter()), expected)
+
+    def test_render_iter_lazy(self):
+        consumed = []
+
+        def rows():
+            for i in range(1000):
+                consumed.append(i)
+                yield {'cell': i}
+        table = Table()(Content('rows', template=Tr()(Td()(Content('cell')))))
+        chunks = table.render_iter(rows=rows())
+        self.assertEqual(next(chunks), '<table>')
+        self.assertEqual(next(chunks), '<tr><td>0</td></tr>')
+        self.assertEqual(len(consumed), 1)
+        self.assertEqual(''.join(chunks).count('<tr>'), 999)
+
+    def test_render_async(self):
+        started = []
+
+        async def fetch(value):
+            # Every fetch waits for the other one to start: awaited one after the other they never complete
+            started.append(value)
+            if len(started) == 2:
+                ready.set()
+            await ready.wait()
+            return value
+
+        async def rows():
+            for i in range(3):
+                await asyncio.sleep(0)
+                yield {'cell': i}
+
+        async def render():
+            nonlocal ready
+            ready = asyncio.Event()
+            return await asyncio.wait_for(page.render_async(first=fetch('a'), second=fetch('b'), rows=rows()), 5)
+        ready = None
+        page = self.page(
+            Body()(
+                P()(Content('first')), P()(Content('second')),
+                Table()(Content('rows', template=Tr()(Td()(Content('cell')))))
+            )
+        )
+        # Independent contents are awaited concurrently
+        result = asyncio.run(render())
+        self.assertEqual(sorted(started), ['a', 'b'])
+        self.assertEqual(result, '<html><body><p>a</p><p>b</p><table>'
+                                 '<tr><td>0</td></tr><tr><td>1</td></tr><tr><td>2</td></tr></table></body></html>')
+
+        async def value():
+            return 'y'
+        self.assertEqual(asyncio.run(Content('x', content=value()).render_async()), 'y')
+
 
 if __name__ == '__main__':
     unittest.main()
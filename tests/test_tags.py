@@ -3,9 +3,13 @@
 @author: Federico Cerchiari <federicocerchiari@gmail.com>
 """
 import unittest
+from unittest import mock
+from copy import copy
 
+from tempy import tempy
 from tempy.tags import *
-from tempy.tempy import DOMElement, Tag, TagAttrs
+from tempy.tempy import DOMElement, Tag, TagAttrs, Content
+from tempy.exceptions import TagError
 
 
 class TestTag(unittest.TestCase):
@@ -64,5 +68,298 @@ class TestTag(unittest.TestCase):
         head, body = self.page.childs
         self.check_head_body(head, body)
 
+    def test_identity(self):
+        div, other = Div(), Div()
+        self.assertIsInstance(hash(div), int)
+        self.assertNotEqual(div.uuid, other.uuid)
+        self.assertEqual(len({div, other, div}), 2)
+        self.assertNotEqual(div, other)
+        self.assertNotEqual(div, 'text')
+        div('text', other)
+        self.assertIn('text', div)
+        self.assertIn(other, div)
+        self.assertEqual(list(Div()(other)._dfs_tags())[0], other)
+
+    def test_traversals(self):
+        a, b, c, d, e = Div(), P(), Span(), A(), Br()
+        a('text', b(c('inner', Content('x')), d), Content('y'), e)
+        self.assertEqual(list(a.dfs_preorder()), [a, b, c, d, e])
+        self.assertEqual(list(a.dfs_postorder()), [c, d, b, e, a])
+        self.assertEqual(list(a._dfs_tags()), [c, d, b, e, a])
+        self.assertEqual(list(a.bfs()), [a, b, e, c, d])
+        self.assertEqual(list(c.ancestors()), [b, a])
+        self.assertEqual(list(a.descendants()), [b, c, d, e])
+        self.assertEqual(list(a.descendants(lambda tag: isinstance(tag, (Span, Br)))), [c, e])
+        self.assertEqual(list(Div().descendants()), [])
+        root = leaf = Div()
+        for _ in range(50000):
+            child = Div()
+            leaf(child)
+            leaf = child
+        self.assertEqual(sum(1 for _ in root.dfs_postorder()), 50001)
+        self.assertEqual(len(list(leaf.ancestors())), 50000)
+
+    def test_slots(self):
+        div = Div()
+        self.assertFalse(hasattr(div, '__dict__'))
+        self.assertFalse(hasattr(Br(), '__dict__'))
+        self.assertIsNone(div._content_data)
+        self.assertIsNone(div._data)
+        div.data('key', 'value')
+        self.assertEqual(div.data('key'), 'value')
+
+    def test_named_childs(self):
+        self.page(Head(), body=Body()(container=Div()))
+        self.assertIs(self.page.body, self.page[1])
+        self.assertIs(self.page.body.container, self.page[1][0])
+        self.assertRaises(AttributeError, getattr, self.page, 'foo')
+        self.page.pop()
+        self.assertRaises(AttributeError, getattr, self.page, 'body')
+
+    def check_indexes(self, tag):
+        for i, child in enumerate(tag):
+            if isinstance(child, DOMElement):
+                self.assertEqual(child.index, i)
+
+    def test_manipulation_indexes(self):
+        ul = Ul()
+        first = Li()
+        ul(first)
+        last = first
+        for _ in range(10000):
+            new = Li()
+            last.after(new)
+            last = new
+        self.assertEqual(len(ul), 10001)
+        self.assertEqual(last.index, 10000)
+        middle = ul[5000]
+        middle.before('text', Li(), Li())
+        self.assertEqual(middle.index, 5003)
+        self.assertEqual(ul[5000], 'text')
+        self.assertIs(middle.prev(), ul[5002])
+        self.assertIs(middle.next(), ul[5004])
+        middle.remove()
+        self.assertIsNone(middle.parent)
+        self.assertEqual(len(ul), 10003)
+        first.remove()
+        self.assertEqual(ul[0].index, 0)
+        ul[10].move(self.page)
+        self.assertEqual(len(ul), 10001)
+        ul[3].replace_with([P(), P()])
+        self.check_indexes(ul)
+        self.assertEqual(len(ul), 10002)
+        ul.empty()
+        self.assertEqual(len(ul), 0)
+        self.assertEqual(len(self.page), 1)
+
+    def test_manipulation_scaling(self):
+        # Inserting or removing siblings must not make the position lookups linear: the identity
+        # comparisons of the scans, made when a stored position is wrong, are counted
+        size = 5000
+        compared = []
+        is_ = tempy.is_
+
+        def counted(a, b):
+            compared.append(a)
+            return is_(a, b)
+
+        def check(pattern):
+            ul = Ul()
+            ul([Li() for _ in range(size)])
+            del compared[:]
+            with mock.patch.object(tempy, 'is_', counted):
+                pattern(ul)
+            self.assertLess(len(compared), 4 * size)
+
+        def before_chain(ul):
+            last = ul[0]
+            for _ in range(size):
+                new = Li()
+                last.before(new)
+                last = new
+            self.assertIs(ul[0], last)
+            self.check_indexes(ul)
+
+        def remove_forward(ul):
+            for item in list(ul):
+                item.remove()
+            self.assertEqual(len(ul), 0)
+
+        def remove_backward_after_shift(ul):
+            ul.prepend(Li(), Li())
+            for item in list(ul)[::-1]:
+                item.remove()
+            self.assertEqual(len(ul), 0)
+
+        def index_backward_after_shift(ul):
+            ul.prepend(Li(), Li())
+            for i, item in reversed(list(enumerate(ul))):
+                self.assertEqual(item.index, i)
+
+        for pattern in (before_chain, remove_forward, remove_backward_after_shift, index_backward_after_shift):
+            check(pattern)
+
+    def test_prepend_append(self):
+        div = Div()(P())
+        div.prepend(A(), B())
+        div.append(I(), Br())
+        self.assertEqual(div.render(), '<div><a></a><b></b><p></p><i></i><br/></div>')
+        self.check_indexes(div)
+
+    def test_bulk_insert(self):
+        tbody = Tbody()
+        tbody(Tr()(Td()(i)) for i in range(10000))
+        self.assertEqual(len(tbody), 10000)
+        self.assertTrue(all(row.parent is tbody for row in tbody))
+        self.check_indexes(tbody)
+        tbody.render()
+        self.assertTrue(tbody.stable)
+        middle = tbody[5000]
+        middle.after([Tr(), [Tr(), Tr()]], named=Tr())
+        self.assertFalse(tbody.stable)
+        self.assertIs(tbody[5004], tbody.named)
+        self.assertEqual(middle.index, 5000)
+        self.check_indexes(tbody)
+        div = Div()(P())
+        div.prepend([A(), (B(), I())], 'text', named=Span())
+        self.assertEqual(div.render(), '<div><a></a><b></b><i></i>text<span></span><p></p></div>')
+        div[-1].before(Br(), Hr())
+        self.assertEqual(div.render(), '<div><a></a><b></b><i></i>text<span></span><br/><hr/><p></p></div>')
+        self.assertIs(div.named, div[4])
+        self.check_indexes(div)
+        self.assertIs(div.append(), div)
+
+    def test_clone(self):
+        layout = Html()(Head()(Title()('Site')),
+                        body=Body()(container=Div(klass='main')(Content('main')), footer=Div()('footer')))
+        layout.inject(main='home')
+        expected = layout.render()
+        page = layout.clone()
+        # Childs are shared until accessed
+        self.assertIsNone(page._childs)
+        self.assertEqual(page.render(), expected)
+        self.assertIsNot(page.attrs, layout.attrs)
+        page.body.container.append(P()('article')).add_class('wide')
+        page.inject(main='article')
+        self.assertEqual(page.render(), '<html><head><title>Site</title></head><body><div class="main wide">'
+                                        'article<p>article</p></div><div>footer</div></body></html>')
+        self.assertIsNone(page[0]._childs)
+        self.assertIsNone(page.body.footer._childs)
+        self.assertEqual(layout.render(), expected)
+        self.assertEqual(layout.body.container.attrs['klass'], ['main'])
+        # Changes to the original are not seen by the copies
+        other = copy(layout)
+        layout.body.footer('!')
+        layout.body.container.inject(main='changed')
+        self.assertEqual(other.render(), expected)
+        self.assertIn('<div>footer!</div>', layout.render())
+        self.assertEqual(other.clone().render(), expected)
+        # Replacing the childs list changes the original only
+        div = Div()(Span()('a'))
+        div.render()
+        copied = div.clone()
+        div.childs = ['z']
+        self.assertEqual(div.render(), '<div>z</div>')
+        self.assertEqual(copied.render(), '<div><span>a</span></div>')
+        self.assertEqual(len(copied.childs), 1)
+        self.assertEqual(copied.render(), '<div><span>a</span></div>')
+
+    def test_query(self):
+        self.page(Body()(
+            Div(id='main', klass='chr').add_class('box')(P()('a'), Span()(P(klass='inner')('b')), P()('c')),
+            Div(klass='chr')(P(id='last')('d')),
+        ))
+        body = self.page[0]
+        main, second = body[0], body[1]
+        self.assertIs(self.page.find(id='main'), main)
+        self.assertEqual(self.page.find_all(klass='chr'), [main, second])
+        self.assertEqual(self.page.find_all(Div, klass='box chr'), [main])
+        self.assertEqual([p.childs[0] for p in self.page.find_all('p')], ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.page.select('div.chr > p'), [main[0], main[2], second[0]])
+        self.assertEqual(self.page.select('div p'), self.page.find_all(P))
+        self.assertEqual(self.page.select('#main .inner, #last'), [main[1][0], second[0]])
+        self.assertEqual(main.select('*'), [main[0], main[1], main[1][0], main[2]])
+        # Ancestors of the queried element match too, results are his descendants
+        self.assertEqual(second.select('body > div > p'), [second[0]])
+        self.assertIsNone(second.find(id='main'))
+        self.assertRaises(TagError, self.page.select, 'div > ')
+        self.assertRaises(TagError, self.page.select, 'a[href]')
+        # The indexed candidates give the same results as the walk
+        factor, DOMElement._query_walk_factor = DOMElement._query_walk_factor, 0
+        try:
+            self.assertIs(self.page.find(id='main'), main)
+            self.assertIs(self.page.find('p'), main[0])
+            self.assertEqual(self.page.select('div.chr > p'), [main[0], main[2], second[0]])
+            self.assertEqual(main.find_all('p'), [main[0], main[1][0], main[2]])
+            self.assertEqual(second.select('body > div > p'), [second[0]])
+            self.assertIsNone(second.find(id='main'))
+        finally:
+            DOMElement._query_walk_factor = factor
+        # The indexes are kept updated by the manipulation api
+        index = self.page._query
+        self.assertIsNotNone(index)
+        new = P(id='new')
+        main[1].append(new)
+        self.assertIs(self.page.find(id='new'), new)
+        self.assertEqual(self.page.select('span > p'), [main[1][0], new])
+        second.remove()
+        self.assertIsNone(self.page.find(id='last'))
+        self.assertEqual(self.page.find_all(klass='chr'), [main])
+        main.attr(id='renamed').add_class('other')
+        self.assertIsNone(self.page.find(id='main'))
+        self.assertEqual(self.page.select('div#renamed.other.chr'), [main])
+        main.remove_class('chr')
+        self.assertEqual(self.page.find_all(klass='chr'), [])
+        self.assertIs(self.page._query, index)
+        # A removed subtree is queried with his own indexes
+        self.assertEqual(second.find_all('p'), [second[0]])
+        removed_index = second._query
+        body.append(second)
+        self.assertFalse(removed_index.active)
+        self.assertIs(second[0]._query, index)
+        self.assertIs(self.page.find(id='last'), second[0])
+        # Trees never queried are not indexed
+        other = Div()(Div()(P(id='x')))
+        other[0].append(Span(id='y'))
+        self.assertIsNone(other[0][1]._query)
+        self.assertIs(other.find(id='y'), other[0][1])
+        self.assertIs(other[0][1]._query, other._query)
+        # A failing selector on a deep tree checks every ancestor once per part
+        root = node = Div()
+        for _ in range(400):
+            node = node(Div()).childs[-1]
+        node(P())
+        checks = []
+        matches = tempy._matches
+
+        def counted(element, compound):
+            checks.append(element)
+            return matches(element, compound)
+        with mock.patch.object(tempy, '_matches', counted):
+            self.assertEqual(root.select('section div div div p'), [])
+            self.assertEqual(root.select('section div > div div p'), [])
+        self.assertLess(len(checks), 10 * 400 * 5)
+
+    def test_attrs_render(self):
+        inp = Input(typ='text', name='q', klass='big')
+        inp.css('color', 'red')
+        self.assertEqual(inp.attrs.render(), ' type="text" name="q" class="big" style="color: red;"')
+        self.assertIs(inp.attrs.render(), inp.attrs.render())
+        inp.attrs['value'] = 'x'
+        self.assertIn(' value="x"', inp.attrs.render())
+        inp.attrs.pop('value')
+        self.assertNotIn('value', inp.attrs.render())
+        inp.add_class('wide')
+        self.assertTrue(inp.has_class('wide'))
+        self.assertIn('class="big wide"', inp.render())
+        inp.remove_class('big')
+        self.assertIn('class="wide"', inp.render())
+        inp.hide()
+        self.assertIn('style="color: red; display: none;"', inp.render())
+        inp.toggle()
+        self.assertIn('style="color: red;"', inp.render())
+        self.assertEqual(Comment('text').render(), '<!-- text -->')
+
+
 if __name__ == '__main__':
     unittest.main()